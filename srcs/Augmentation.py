@@ -1,14 +1,16 @@
-from typing import List, Tuple, Optional
+from __future__ import annotations
+
+from typing import List, Tuple, Optional, TYPE_CHECKING
 import math
 import argparse
-import tensorflow as tf
 import numpy as np
-import matplotlib.pyplot as plt
-from utils.augmentation import augment_image, augment_dataset
-from utils.hyperparams import IMG_HEIGHT, IMG_WIDTH
+from utils.hyperparams import add_hyperparams_arguments, hyperparams_from_args
 from pathlib import Path
 from tqdm import tqdm
-from utils.cache import tf_cache
+from utils.export import EXPORT_FORMATS, export_dataset
+
+if TYPE_CHECKING:
+    import tensorflow as tf
 
 
 def save_dataset(dataset: tf.data.Dataset, name: str, class_names: List[str]) -> None:
@@ -20,6 +22,8 @@ def save_dataset(dataset: tf.data.Dataset, name: str, class_names: List[str]) ->
         name: Directory name to save the dataset
         class_names: List of class names
     """
+    import tensorflow as tf
+
     class_counters = {class_name: 0 for class_name in class_names}
     directory = Path(name)
     directory.mkdir(parents=True, exist_ok=True)
@@ -47,6 +51,7 @@ def save_images(
     Args:
         images: List of (image, augmentation_name) tuples
     """
+    import tensorflow as tf
 
     image_name = image_path.stem
     image_extension = image_path.suffix.lower() if image_path.suffix else ".jpg"
@@ -69,6 +74,7 @@ def display_augmented_image(images: List[Tuple[np.ndarray, Optional[str]]]) -> N
         image: Original image
         augmented_images: List of (name, augmented_image) tuples
     """
+    import matplotlib.pyplot as plt
 
     IMAGE_FIGSIZE = (3, 3)
     IMAGE_COLS = 4
@@ -111,34 +117,71 @@ def main() -> None:
     parser.add_argument(
         "image_path", help="The path to the image you are trying to augment"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of threads augmenting a directory",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the augmentations of a directory (random by default)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="jpg",
+        help="Save an augmented directory as JPEG files, TFRecord shards or a "
+        "memory-mapped .npy array (the last two can be read by train.py)",
+    )
+    add_hyperparams_arguments(parser, ("img_height", "img_width"))
     args = parser.parse_args()
 
     try:
+        hyperparams = hyperparams_from_args(args)
         path = Path(args.image_path)
         if not path.exists():
             raise FileNotFoundError("The specified path does not exist")
 
         if path.is_dir():
+            import tensorflow as tf
+            from utils.augmentation import augment_dataset
+            from utils.cache import tf_cache
+
             print(f"📁 Processing directory: {path}")
             dataset = tf.keras.utils.image_dataset_from_directory(
                 directory=str(path),
                 labels="inferred",
                 label_mode="int",
-                image_size=(IMG_HEIGHT, IMG_WIDTH),
+                image_size=hyperparams.image_size,
                 batch_size=None,
             )
             class_names = dataset.class_names
 
             with tf_cache() as cache_dirs:
-                dataset = augment_dataset(dataset, cache_dirs.augmentation)
+                dataset = augment_dataset(
+                    dataset,
+                    cache_dirs.augmentation,
+                    workers=args.workers,
+                    seed=args.seed,
+                )
                 dataset = dataset.prefetch(tf.data.AUTOTUNE)
-                save_dataset(dataset, "augmented_directory", class_names)
+                if args.format == "jpg":
+                    save_dataset(dataset, "augmented_directory", class_names)
+                else:
+                    export_dataset(
+                        dataset, "augmented_directory", class_names, args.format
+                    )
 
             return
 
+        from utils.augmentation import augment_image
+        from utils.images import load_image
+
         print(f"🖼️  Processing single image: {path}")
-        image = tf.keras.utils.load_img(str(path), target_size=(IMG_HEIGHT, IMG_WIDTH))
-        image_array = tf.keras.utils.img_to_array(image).astype(np.uint8)
+        image_array = load_image(str(path), hyperparams.image_size)
 
         images = augment_image(image_array)
         display_augmented_image(images)
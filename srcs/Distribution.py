@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import argparse
 
 from typing import List
@@ -7,6 +6,8 @@ from utils.parsing import parse, Type, Config
 
 
 def plot_types(types: List[Type]) -> None:
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(len(types), 2)
     for i, type in enumerate(types):
         sizes = type.labels.values()
@@ -1,12 +1,76 @@
-import tensorflow as tf
 from argparse import Namespace
-from utils.transforms import transform_one_image, transform_dataset
 from utils.parsing.args import parse_args
-from utils.hyperparams import IMG_HEIGHT, IMG_WIDTH
-from utils.cache import tf_cache
-from Augmentation import save_dataset
-from utils.plotting.grid import show_grid
-import numpy as np
+from utils.hyperparams import Hyperparams, hyperparams_from_args
+from utils.profiling import profiling, stage
+
+
+def transform_multi(args: Namespace, hyperparams: Hyperparams) -> None:
+    """
+    Transform a whole dataset directory into `args.dst`.
+
+    TensorFlow is only imported here: the single image mode does not need it.
+    """
+    import tensorflow as tf
+    from utils.transforms import transform_dataset, transformation_cache_key
+    from utils.cache import PersistentCache
+    from utils.export import export_dataset
+    from utils.incremental import transform_directory
+    from Augmentation import save_dataset
+
+    path = args.src
+    if args.incremental:
+        if args.format != "jpg":
+            raise ValueError("--incremental only writes --format jpg")
+        print(f"📁 Updating {args.dst} from directory: {path}")
+        stage("transform")
+        transform_directory(
+            path,
+            args.dst,
+            args.ops,
+            workers=args.workers,
+            image_size=hyperparams.image_size,
+        )
+        return
+
+    print(f"📁 Processing directory: {path}")
+    stage("load")
+    dataset = tf.keras.utils.image_dataset_from_directory(
+        directory=str(path),
+        labels="inferred",
+        label_mode="int",
+        image_size=hyperparams.image_size,
+        batch_size=None,
+        # Stable order so the persistent cache can be reused
+        shuffle=False,
+    )
+    class_names = dataset.class_names
+
+    persistent_cache = PersistentCache()
+    cache_key = transformation_cache_key(
+        dataset.file_paths, args.ops, hyperparams.image_size
+    )
+
+    transformed_dataset = transform_dataset(
+        dataset,
+        args.ops,
+        persistent_cache.path(cache_key),
+        workers=args.workers,
+        # Trimmed once the new entry is on disk, so it counts
+        on_cached=lambda: persistent_cache.evict(keep=cache_key),
+    )
+    transformed_dataset = transformed_dataset.prefetch(tf.data.AUTOTUNE)
+    # Transformed lazily, while the images are saved
+    stage("transform")
+    if args.format == "jpg":
+        save_dataset(transformed_dataset, args.dst.name, class_names)
+    else:
+        export_dataset(
+            transformed_dataset,
+            args.dst,
+            class_names,
+            args.format,
+            ops=args.ops,
+        )
 
 
 def main() -> None:
@@ -17,37 +81,26 @@ def main() -> None:
     args: Namespace = parse_args()
 
     try:
+        hyperparams = hyperparams_from_args(args)
         if args.mode == "multi":
-            path = args.src
-            if path.is_dir():
-                print(f"📁 Processing directory: {path}")
-                dataset = tf.keras.utils.image_dataset_from_directory(
-                    directory=str(path),
-                    labels="inferred",
-                    label_mode="int",
-                    image_size=(IMG_HEIGHT, IMG_WIDTH),
-                    batch_size=None,
-                )
-                class_names = dataset.class_names
-
-                with tf_cache() as cache_dirs:
-                    transformed_dataset = transform_dataset(
-                        dataset,
-                        args.ops,
-                        cache_dirs.transformation,
-                    )
-                    transformed_dataset = transformed_dataset.prefetch(tf.data.AUTOTUNE)
-                    save_dataset(transformed_dataset, args.dst.name, class_names)
-
+            if args.src.is_dir():
+                with profiling(args.profile):
+                    transform_multi(args, hyperparams)
                 return
 
-        image = tf.keras.utils.load_img(
-            str(args.path),
-            target_size=(IMG_HEIGHT, IMG_WIDTH),
-        )
-        image_array = tf.keras.utils.img_to_array(image).astype(np.uint8)
+        from utils.images import load_image
+        from utils.transforms import transform_one_image
+        from utils.plotting.grid import show_grid
+
+        with profiling(args.profile):
+            stage("load")
+            image_array = load_image(str(args.path), hyperparams.image_size)
 
-        images = transform_one_image(image_array, args.ops)
+            # The PlantCV engine also draws the analysis image shown in the grid
+            stage("transform")
+            images = transform_one_image(
+                image_array, args.ops, {"analyse": {"engine": "plantcv"}}
+            )
         show_grid([img for img, _ in images], [name for _, name in images])
 
     except Exception as e:
@@ -0,0 +1,59 @@
+import argparse
+import time
+import numpy as np
+from typing import Dict, List
+from transforms.context import OpContext
+from transforms.registry import build
+from benchmarks.synthetic import leaf_images
+
+
+def _masks(images: np.ndarray) -> List[OpContext]:
+    rgb2lab, mask = build("rgb2lab"), build("mask")
+    ctxs = [OpContext() for _ in images]
+    rgb2lab.apply_batch(images, ctxs)
+    mask.apply_batch(images, ctxs)
+    return ctxs
+
+
+def _time_engine(
+    engine: str, images: np.ndarray, ctxs: List[OpContext]
+) -> tuple[float, List[Dict[str, Dict[str, float]]]]:
+    analyse = build("analyse", engine=engine)
+    results = []
+    start = time.perf_counter()
+    for image, ctx in zip(images, ctxs):
+        ctx = OpContext(mask=ctx.mask)
+        analyse.apply(image, ctx)
+        results.append(ctx.analyse_results)
+    return (time.perf_counter() - start) / len(images), results
+
+
+def main() -> None:
+    """
+    Compare the per-image cost of both Analyse engines on synthetic leaves.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=100, help="Number of images")
+    args = parser.parse_args()
+
+    images = leaf_images(args.images)
+    ctxs = _masks(images)
+
+    plantcv_time, expected = _time_engine("plantcv", images, ctxs)
+    moments_time, actual = _time_engine("moments", images, ctxs)
+
+    mismatches = sum(
+        not np.isclose(e[channel][key], a[channel][key])
+        for e, a in zip(expected, actual)
+        for channel in e
+        for key in e[channel]
+    )
+
+    print(f"{'engine':<10}{'ms/image':>10}")
+    print(f"{'plantcv':<10}{plantcv_time * 1000:>10.2f}")
+    print(f"{'moments':<10}{moments_time * 1000:>10.2f}")
+    print(f"➡️  Speedup: {plantcv_time / moments_time:.1f}x, mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
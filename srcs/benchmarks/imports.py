@@ -0,0 +1,97 @@
+import argparse
+import subprocess
+import sys
+import time
+from typing import List, NamedTuple, Set
+
+
+# Modules that take seconds to import and must only load on the paths using them
+HEAVY_MODULES = ("tensorflow", "keras", "plantcv", "matplotlib")
+
+
+class Case(NamedTuple):
+    name: str
+    # Arguments given to the interpreter
+    argv: List[str]
+
+
+CASES = [
+    Case("Distribution.py --help", ["Distribution.py", "--help"]),
+    Case("Transformation.py --help", ["Transformation.py", "--help"]),
+    Case("Augmentation.py --help", ["Augmentation.py", "--help"]),
+    Case("predict.py --help", ["predict.py", "--help"]),
+    Case("train.py --help", ["train.py", "--help"]),
+    Case(
+        "transform_one_image",
+        ["-c", "from utils.transforms import transform_one_image"],
+    ),
+    Case("augment_image", ["-c", "from utils.augmentation import augment_image"]),
+    Case("utils.parsing.model", ["-c", "import utils.parsing.model"]),
+]
+
+
+def _run(case: Case) -> tuple[float, Set[str]]:
+    """
+    Run a case in a fresh interpreter.
+
+    Returns:
+        Wall time in seconds, and the heavy modules it imported
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *case.argv],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    modules = {
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    heavy = {
+        root
+        for root in HEAVY_MODULES
+        for module in modules
+        if module == root or module.startswith(f"{root}.")
+    }
+    return elapsed, heavy
+
+
+def main() -> None:
+    """
+    Time the startup of every entry point and light import path.
+
+    Exits with an error if one of them imports a heavy module, or is slower
+    than `--max-seconds`, so it can guard against regressions.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case")
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Fail if the fastest run of a case is slower than this",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'case':<28}{'seconds':>10}  heavy imports")
+    for case in CASES:
+        runs = [_run(case) for _ in range(args.repeats)]
+        elapsed = min(seconds for seconds, _ in runs)
+        heavy = set().union(*(modules for _, modules in runs))
+        too_slow = args.max_seconds is not None and elapsed > args.max_seconds
+        failed |= bool(heavy) or too_slow
+        print(f"{case.name:<28}{elapsed:>10.2f}  {', '.join(sorted(heavy)) or '-'}")
+
+    if failed:
+        print("❌ Startup regression detected.")
+        sys.exit(1)
+    print("✅ No heavy module imported at startup.")
+
+
+if __name__ == "__main__":
+    main()
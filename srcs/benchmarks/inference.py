@@ -0,0 +1,168 @@
+import argparse
+import io
+import json
+import time
+import zipfile
+import numpy as np
+from pathlib import Path
+from PIL import Image
+from typing import Any, Dict, List, Optional, Tuple
+from utils.hyperparams import DEFAULTS
+from utils.images import load_image
+from utils.inference import LITE_VARIANTS
+from utils.parsing.model import ZIP_PATH, load_model_from_zip
+from utils.transforms import transform_images
+
+
+def _embedded_test_split(zipf: zipfile.ZipFile) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode the test images embedded by `save_to_zip`, already transformed.
+    """
+    class_names = json.loads(zipf.read("model/classes.json"))
+    images, labels = [], []
+    for name in sorted(zipf.namelist()):
+        if name.startswith("data/test/") and name.endswith(".jpg"):
+            with Image.open(io.BytesIO(zipf.read(name))) as img:
+                images.append(np.asarray(img.convert("RGB")))
+            labels.append(class_names.index(name.split("/")[2]))
+    return np.stack(images), np.array(labels)
+
+
+def _manifest_test_split(manifest: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the source images of the test split of a manifest and transform them.
+    """
+    if manifest["file_paths"] is None:
+        raise SystemExit("❌ The test split references an export, not images.")
+    test = manifest["splits"]["test"]
+    image_size = tuple(manifest.get("image_size", DEFAULTS.image_size))
+    images = [
+        load_image(manifest["file_paths"][i], image_size) for i in test["positions"]
+    ]
+    transformed = transform_images(images, manifest["ops"])
+    return np.stack([image.astype(np.uint8) for image in transformed]), np.array(
+        test["labels"]
+    )
+
+
+def load_test_split(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the test split saved with a model.
+
+    Args:
+        path: Path of the zip file
+
+    Returns:
+        Tuple of (transformed uint8 images, labels)
+    """
+    with zipfile.ZipFile(path) as zipf:
+        names = set(zipf.namelist())
+        if "data/manifest.json" in names:
+            return _manifest_test_split(json.loads(zipf.read("data/manifest.json")))
+        if any(name.startswith("data/test/") for name in names):
+            return _embedded_test_split(zipf)
+    raise SystemExit("❌ No test split saved, train without --save-datasets skip.")
+
+
+def _benchmark(
+    model: Any, images: np.ndarray, repeats: int
+) -> Tuple[Dict[str, float], np.ndarray]:
+    """
+    Time a model on single images, then on the whole split in batches.
+
+    Returns:
+        Tuple of (timings, predicted probabilities)
+    """
+    # The first call allocates the buffers of the model
+    model.predict_on_batch(images[:1])
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        model.predict_on_batch(images[i % len(images)][np.newaxis])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predictions = np.concatenate(
+        [
+            model.predict_on_batch(images[i : i + DEFAULTS.batch_size])
+            for i in range(0, len(images), DEFAULTS.batch_size)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+
+    timings = {
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p90_ms": float(np.percentile(latencies, 90) * 1000),
+        "images_per_sec": len(images) / elapsed,
+    }
+    return timings, predictions
+
+
+def main() -> None:
+    """
+    Compare the latency and accuracy of every inference backend on the test split.
+
+    The Keras model is the reference: the other backends report how often
+    their top-1 class agrees with it, and their largest probability error.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=ZIP_PATH, help="Path of model.zip")
+    parser.add_argument(
+        "--repeats", type=int, default=50, help="Single-image predictions timed"
+    )
+    parser.add_argument("--output", type=Path, help="Also write the results to JSON")
+    args = parser.parse_args()
+
+    images, labels = load_test_split(args.model)
+    print(f"⏳ Benchmarking on {len(images)} test images...")
+
+    backends = [("keras", "")]
+    backends += [("tflite", variant) for variant in LITE_VARIANTS]
+    backends.append(("numpy", ""))
+
+    results: List[Dict[str, Any]] = []
+    reference: Optional[np.ndarray] = None
+    for backend, variant in backends:
+        start = time.perf_counter()
+        try:
+            model = load_model_from_zip(args.model, backend, variant or "float16")
+        except ValueError as e:
+            print(f"➡️  Skipping {backend} {variant}: {e}")
+            continue
+        load_seconds = time.perf_counter() - start
+
+        timings, predictions = _benchmark(model, images, args.repeats)
+        if reference is None:
+            reference = predictions
+        results.append(
+            {
+                "backend": f"{backend} {variant}".strip(),
+                "load_seconds": load_seconds,
+                **timings,
+                "accuracy": float(np.mean(predictions.argmax(axis=1) == labels)),
+                "agreement": float(
+                    np.mean(predictions.argmax(axis=1) == reference.argmax(axis=1))
+                ),
+                "max_error": float(np.abs(predictions - reference).max()),
+            }
+        )
+
+    print(
+        f"{'backend':<16}{'load s':>8}{'p50 ms':>9}{'p90 ms':>9}{'img/s':>9}"
+        f"{'accuracy':>10}{'agreement':>11}{'max error':>11}"
+    )
+    for result in results:
+        print(
+            f"{result['backend']:<16}{result['load_seconds']:>8.2f}"
+            f"{result['p50_ms']:>9.2f}{result['p90_ms']:>9.2f}"
+            f"{result['images_per_sec']:>9.1f}{result['accuracy']:>10.2%}"
+            f"{result['agreement']:>11.2%}{result['max_error']:>11.2e}"
+        )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
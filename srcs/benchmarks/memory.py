@@ -0,0 +1,74 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from benchmarks.suite import commit_hash
+from benchmarks.synthetic import leaf_images
+from utils.hyperparams import DEFAULTS
+from utils.profiling import current_memory, peak_memory, reset_peak_memory
+from utils.serving import PREDICT_OPS
+from utils.transforms import transform_images
+
+MB = 1024 * 1024
+
+
+def main() -> None:
+    """
+    Measure the peak memory of transforming a large directory, chunk by chunk.
+
+    Synthetic leaves are generated one chunk at a time and go through the ops
+    like `Transformation.py multi --workers 1` or `train.py` would run them,
+    so only the memory the ops hold at once shows above the baseline.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=2048, help="Number of images")
+    parser.add_argument(
+        "--chunk-size", type=int, default=64, help="Images transformed together"
+    )
+    parser.add_argument(
+        "--ops",
+        type=lambda s: s.split(","),
+        default=PREDICT_OPS,
+        help="Comma-separated list of ops",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Write the results to this JSON"
+    )
+    args = parser.parse_args()
+
+    # Imports, op building and the first allocations are not what is measured
+    transform_images(list(leaf_images(1)), args.ops)
+    baseline = current_memory()
+    reset_peak_memory()
+
+    print(f"⏳ Transforming {args.images} synthetic images...")
+    start = time.perf_counter()
+    for seed, first in enumerate(range(0, args.images, args.chunk_size)):
+        count = min(args.chunk_size, args.images - first)
+        transform_images(list(leaf_images(count, seed=seed)), args.ops)
+    seconds = time.perf_counter() - start
+    peak = peak_memory()
+
+    print(f"{'baseline MB':>12}{'peak MB':>10}{'above MB':>10}{'per sec':>10}")
+    print(
+        f"{baseline / MB:>12.1f}{peak / MB:>10.1f}{(peak - baseline) / MB:>10.1f}"
+        f"{args.images / seconds:>10.1f}"
+    )
+
+    if args.output is not None:
+        report = {
+            "commit": commit_hash(),
+            "ops": args.ops,
+            "images": args.images,
+            "chunk_size": args.chunk_size,
+            "image_size": list(DEFAULTS.image_size),
+            "baseline_bytes": baseline,
+            "peak_bytes": peak,
+            "seconds": seconds,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import copy
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from benchmarks.synthetic import leaf_images
+from transforms.base import Transformation
+from transforms.context import OpContext
+from transforms.registry import available_ops
+from utils.hyperparams import DEFAULTS
+from utils.serving import PREDICT_OPS
+from utils.transforms import build_ops, transform_images
+
+GROUPS = (
+    "ops",
+    "chain",
+    "augment_image",
+    "augment_dataset",
+    "save_to_zip",
+    "load_model_from_zip",
+    "predict",
+)
+
+# Share of the synthetic images in each class of the augment_dataset case
+CLASS_SHARES = (0.6, 0.3, 0.1)
+CLASS_NAMES = ["healthy", "rust", "scab"]
+
+# Runs this long are timed once after the warm-up, instead of `repeats` times
+SLOW_RUN_SECONDS = 2.0
+
+
+class Result(NamedTuple):
+    name: str
+    # What is counted: "images", or "models" for the loading cases
+    unit: str
+    count: int
+    # Median of the repeats
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.count / self.seconds
+
+
+def _time(run: Callable[[], Any], repeats: int) -> float:
+    """
+    Median wall time of `run`, after one untimed call that warms caches up.
+
+    After a slow warm-up call, a single warm call is timed.
+    """
+    start = time.perf_counter()
+    run()
+    if time.perf_counter() - start > SLOW_RUN_SECONDS:
+        repeats = 1
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def _run_op(
+    op: Transformation, images: List[np.ndarray], ctxs: List[OpContext]
+) -> List[np.ndarray]:
+    if hasattr(op, "apply_batch"):
+        return list(op.apply_batch(np.stack(images), ctxs))
+    return [op.apply(image, ctx) for image, ctx in zip(images, ctxs)]
+
+
+def bench_ops(images: np.ndarray, repeats: int) -> List[Result]:
+    """
+    Time every registered op alone, on the outputs of its dependencies.
+    """
+    results = []
+    for name in available_ops():
+        *deps, op = build_ops([name])
+        inputs: List[np.ndarray] = list(images)
+        ctxs = [OpContext() for _ in images]
+        for dep in deps:
+            inputs = _run_op(dep, inputs, ctxs)
+
+        def run() -> None:
+            # Ops write into the context, each run starts from the same one
+            _run_op(op, [image.copy() for image in inputs], list(map(copy.copy, ctxs)))
+
+        seconds = _time(run, repeats)
+        results.append(Result(f"op {name}", "images", len(images), seconds))
+    return results
+
+
+def bench_chain(images: np.ndarray, repeats: int) -> List[Result]:
+    """
+    Time the ops applied before training and prediction, with their dependencies.
+    """
+    seconds = _time(lambda: transform_images(list(images), PREDICT_OPS), repeats)
+    return [Result(f"chain {','.join(PREDICT_OPS)}", "images", len(images), seconds)]
+
+
+def bench_augment_image(images: np.ndarray, repeats: int) -> List[Result]:
+    """
+    Time the augmentations shown by Augmentation.py, per source image.
+    """
+    from utils.augmentation import augment_image
+
+    def run() -> None:
+        for image in images:
+            augment_image(image)
+
+    return [Result("augment_image", "images", len(images), _time(run, repeats))]
+
+
+def _imbalanced_dataset(images: np.ndarray) -> Any:
+    """
+    Label the images with classes of `CLASS_SHARES` sizes, like a raw dataset.
+    """
+    import tensorflow as tf
+
+    counts = [int(share * len(images)) for share in CLASS_SHARES]
+    counts[0] += len(images) - sum(counts)
+    labels = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    dataset = tf.data.Dataset.from_tensor_slices((images.astype(np.float32), labels))
+    dataset.class_names = CLASS_NAMES
+    return dataset
+
+
+def bench_augment_dataset(
+    images: np.ndarray, repeats: int, workers: int
+) -> List[Result]:
+    """
+    Time the balancing of an imbalanced dataset, counting the images it outputs.
+    """
+    from utils.augmentation import augment_dataset
+
+    dataset = _imbalanced_dataset(images)
+    counts: List[int] = []
+
+    def run() -> None:
+        # Cached in memory, and rebuilt so every run augments again
+        augmented = augment_dataset(dataset, "", workers=workers, seed=0)
+        counts.append(sum(1 for _ in augmented.as_numpy_iterator()))
+
+    seconds = _time(run, repeats)
+    return [Result("augment_dataset", "images", counts[-1], seconds)]
+
+
+def _save_model(
+    images: np.ndarray, repeats: int, workers: int, timed: bool
+) -> List[Result]:
+    """
+    Save an untrained model and the images as its datasets to `ZIP_PATH`.
+    """
+    from utils.build_model import build_model
+    from utils.inference import convert_to_tflite
+    from utils.parsing.model import save_to_zip
+
+    model = build_model(DEFAULTS, len(CLASS_NAMES))
+    model.class_names = CLASS_NAMES
+    lite_models = {"float16": convert_to_tflite(model, "float16")}
+
+    # Split 70/20/10 like train.py, shuffled so every split has every class
+    dataset = _imbalanced_dataset(images).shuffle(
+        len(images), seed=0, reshuffle_each_iteration=False
+    )
+    train, validation = int(0.7 * len(images)), int(0.2 * len(images))
+    splits = [
+        dataset.take(train),
+        dataset.skip(train).take(validation),
+        dataset.skip(train + validation),
+    ]
+    splits = [split.batch(DEFAULTS.batch_size) for split in splits]
+
+    def run() -> None:
+        save_to_zip(model, *splits, workers=workers, lite_models=lite_models)
+
+    if not timed:
+        run()
+        return []
+    return [Result("save_to_zip", "images", len(images), _time(run, repeats))]
+
+
+def bench_load_model(repeats: int) -> List[Result]:
+    """
+    Time cold loads of the saved model with every backend.
+    """
+    from utils.inference import BACKENDS
+    from utils.parsing import model as model_module
+
+    results = []
+    for backend in BACKENDS:
+
+        def run() -> None:
+            # Loaded models are cached by path, a benchmark wants the cold load
+            model_module._MODELS.clear()
+            model_module.load_model_from_zip(backend=backend)
+
+        results.append(
+            Result(f"load_model_from_zip {backend}", "models", 1, _time(run, repeats))
+        )
+    return results
+
+
+def bench_predict(images: np.ndarray, repeats: int) -> List[Result]:
+    """
+    Time `predict` on one image at a time, then on batches, with every backend.
+    """
+    from utils.inference import BACKENDS
+    from utils.parsing.model import load_model_from_zip
+
+    inputs = images.astype(np.float32)
+    results = []
+    for backend in BACKENDS:
+        model = load_model_from_zip(backend=backend)
+
+        def single() -> None:
+            for image in inputs:
+                model.predict(image[np.newaxis], verbose=0)
+
+        def batched() -> None:
+            for i in range(0, len(inputs), DEFAULTS.batch_size):
+                model.predict(inputs[i : i + DEFAULTS.batch_size], verbose=0)
+
+        for mode, run in (("single", single), ("batched", batched)):
+            seconds = _time(run, repeats)
+            results.append(
+                Result(f"predict {backend} {mode}", "images", len(inputs), seconds)
+            )
+    return results
+
+
+def run_suite(
+    groups: Sequence[str], images: np.ndarray, repeats: int, workers: int
+) -> List[Result]:
+    """
+    Run the selected groups of cases.
+
+    The model cases run in a temporary directory, where `save_to_zip` writes
+    the archive the loading and prediction cases read.
+
+    Args:
+        groups: Names from `GROUPS`
+        images: Synthetic images
+        repeats: Timed runs per case
+        workers: Threads of the cases that take some
+
+    Returns:
+        One result per case
+    """
+    results: List[Result] = []
+    if "ops" in groups:
+        results += bench_ops(images, repeats)
+    if "chain" in groups:
+        results += bench_chain(images, repeats)
+    if "augment_image" in groups:
+        results += bench_augment_image(images, repeats)
+    if "augment_dataset" in groups:
+        results += bench_augment_dataset(images, repeats, workers)
+
+    model_groups = {"save_to_zip", "load_model_from_zip", "predict"} & set(groups)
+    if not model_groups:
+        return results
+    with tempfile.TemporaryDirectory() as directory, contextlib.chdir(directory):
+        timed = "save_to_zip" in groups
+        results += _save_model(images, repeats, workers, timed)
+        if "load_model_from_zip" in groups:
+            results += bench_load_model(repeats)
+        if "predict" in groups:
+            results += bench_predict(images, repeats)
+    return results
+
+
+def commit_hash() -> Optional[str]:
+    """
+    Short hash of the checked out commit, recorded with benchmark results.
+
+    Returns:
+        The hash, or None outside of a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(
+    results: List[Result], baseline: Optional[Dict[str, float]]
+) -> None:
+    header = f"{'case':<52}{'count':>7}{'seconds':>10}{'per sec':>10}"
+    print(header + (f"{'vs base':>11}" if baseline is not None else ""))
+    for result in results:
+        line = (
+            f"{result.name:<52}{result.count:>7}{result.seconds:>10.3f}"
+            f"{result.per_second:>10.1f}"
+        )
+        if baseline is not None and result.name in baseline:
+            line += f"{result.per_second / baseline[result.name] - 1:>+11.1%}"
+        print(line)
+
+
+def main() -> None:
+    """
+    Measure the throughput of the hot paths on synthetic leaves.
+
+    Results are written to JSON with the commit they ran on, and can be
+    compared against a previous run with --baseline.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=32, help="Number of images")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per case")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Threads of augment_dataset and save_to_zip",
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=GROUPS, default=list(GROUPS), help="Cases to run"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Write the results to this JSON"
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="JSON of a previous run, to print the change of every case",
+    )
+    args = parser.parse_args()
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+
+    baseline = None
+    if args.baseline is not None:
+        previous = json.loads(args.baseline.read_text())
+        baseline = {
+            result["name"]: result["per_second"] for result in previous["results"]
+        }
+
+    images = leaf_images(args.images)
+    print(f"⏳ Benchmarking on {args.images} synthetic images...")
+    results = run_suite(args.only, images, args.repeats, args.workers)
+    _print_results(results, baseline)
+
+    if args.output is not None:
+        report = {
+            "commit": commit_hash(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "images": args.images,
+            "image_size": list(DEFAULTS.image_size),
+            "repeats": args.repeats,
+            "results": [
+                {**result._asdict(), "per_second": result.per_second}
+                for result in results
+            ],
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import numpy as np
+import cv2
+from utils.hyperparams import DEFAULTS
+
+
+def leaf_images(
+    n: int,
+    height: int = DEFAULTS.img_height,
+    width: int = DEFAULTS.img_width,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Generate leaf-like RGB images so benchmarks run without a dataset.
+
+    Each image is a green ellipse with brown spots on a noisy light background,
+    which goes through the whole PlantCV chain like a real leaf picture.
+
+    Args:
+        n: Number of images
+        height: Image height
+        width: Image width
+        seed: Seed of the random generator
+
+    Returns:
+        (N, H, W, 3) uint8 images
+    """
+    rng = np.random.default_rng(seed)
+    images = np.empty((n, height, width, 3), dtype=np.uint8)
+
+    for i in range(n):
+        image = rng.integers(195, 230, (height, width, 3), dtype=np.uint8)
+        center = (
+            int(width / 2 + rng.integers(-width // 10, width // 10)),
+            int(height / 2 + rng.integers(-height // 10, height // 10)),
+        )
+        axes = (
+            int(rng.integers(width // 4, width * 2 // 5)),
+            int(rng.integers(height // 6, height // 4)),
+        )
+        green = (int(rng.integers(30, 70)), int(rng.integers(110, 180)), 40)
+        cv2.ellipse(image, center, axes, int(rng.integers(0, 180)), 0, 360, green, -1)
+
+        for _ in range(int(rng.integers(0, 8))):
+            spot = (
+                int(center[0] + rng.integers(-axes[0] // 2, axes[0] // 2 + 1)),
+                int(center[1] + rng.integers(-axes[1] // 2, axes[1] // 2 + 1)),
+            )
+            radius = int(rng.integers(2, max(3, width // 32)))
+            cv2.circle(image, spot, radius, (140, 90, 30), -1)
+
+        images[i] = image
+
+    return images
@@ -1,10 +1,27 @@
 import argparse
-import numpy as np
-import tensorflow as tf
-from utils.parsing.model import load_model_from_zip
-from utils.hyperparams import IMG_HEIGHT, IMG_WIDTH
-from utils.plotting.grid import show_grid
-from utils.transforms import transform_one_image
+import os
+import sys
+from pathlib import Path
+from utils.hyperparams import add_hyperparams_arguments, hyperparams_from_args
+from utils.inference import BACKENDS, LITE_VARIANTS
+
+
+def _check_inputs(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    Add the inputs listed by --inputs-from to `image_path` and validate them.
+    """
+    if args.inputs_from is not None:
+        if args.output is None:
+            parser.error("--inputs-from requires --output")
+        try:
+            lines = args.inputs_from.read_text().splitlines()
+        except OSError as e:
+            parser.error(f"cannot read --inputs-from: {e}")
+        args.image_path += [line.strip() for line in lines if line.strip()]
+    if not args.serve and not args.image_path:
+        parser.error("image_path is required unless --serve is given")
+    if not args.serve and args.output is None and len(args.image_path) > 1:
+        parser.error("several images require --output")
 
 
 def main() -> None:
@@ -12,30 +29,114 @@ def main() -> None:
     Load a trained model and predict the class of a given image.
     """
     # https://github.com/tensorflow/tensorflow/issues/68593
-    import os
-
     os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "image_path", help="The path to the image you are trying to augment"
+        "image_path",
+        nargs="*",
+        help="The image to classify. With --output: images, directories or glob "
+        "patterns",
+    )
+    parser.add_argument(
+        "--inputs-from",
+        type=Path,
+        default=None,
+        help="File listing more inputs for --output, one per line",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Classify every input image without display and write the "
+        "predictions to this CSV (.csv) or JSON lines file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes preprocessing images with --output",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep the model loaded and answer image paths read from stdin "
+        "with one JSON line each",
     )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=None,
+        help="Maximum number of images per model call when serving (defaults "
+        "to the batch size)",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        default=50,
+        help="Maximum time to wait for a batch to fill when serving",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="keras",
+        help="Run the model with Keras, a TFLite interpreter, or NumPy only "
+        "(no TensorFlow needed)",
+    )
+    parser.add_argument(
+        "--variant",
+        choices=LITE_VARIANTS,
+        default="float16",
+        help="TFLite model to run with --backend tflite",
+    )
+    add_hyperparams_arguments(parser, ("batch_size",))
     args = parser.parse_args()
+    _check_inputs(parser, args)
 
     try:
-        image = tf.keras.utils.load_img(
-            args.image_path, target_size=(IMG_HEIGHT, IMG_WIDTH)
-        )
-        image_array = tf.keras.utils.img_to_array(image).astype(np.uint8)
+        hyperparams = hyperparams_from_args(args)
+        # Imported once the arguments are valid, so --help stays instant
+        import numpy as np
+        from utils.parsing.model import load_model_from_zip
+        from utils.images import load_image
+        from utils.plotting.grid import show_grid
+        from utils.serving import PREDICT_OPS, serve
+        from utils.bulk_predict import expand_inputs, predict_files
+        from utils.transforms import transform_one_image
 
-        transformed_images = transform_one_image(
-            image_array, ["hull_xor_fill", "remove_background", "crop_blur"]
-        )
+        if args.serve:
+            model = load_model_from_zip(backend=args.backend, variant=args.variant)
+            print("✅ Model loaded, waiting for requests.", file=sys.stderr)
+            serve(
+                model,
+                sys.stdin,
+                sys.stdout,
+                args.max_batch_size or hyperparams.batch_size,
+                args.max_latency_ms / 1000,
+            )
+            return
+
+        if args.output is not None:
+            paths = expand_inputs(args.image_path)
+            print(f"⏳ Classifying {len(paths)} images...")
+            model = load_model_from_zip(backend=args.backend, variant=args.variant)
+            timings = predict_files(
+                model, paths, args.output, hyperparams.batch_size, args.workers
+            )
+            print(f"✅ Predictions saved to {args.output}")
+            print(f"➡️  Throughput: {len(paths) / timings['total']:.1f} images/sec")
+            for stage in ("load", "transform", "predict", "write", "total"):
+                print(f"   {stage:<10} {timings[stage]:>8.2f}s")
+            return
+
+        # Loaded first: images are resized to the resolution it was trained at
+        model = load_model_from_zip(backend=args.backend, variant=args.variant)
+        image_array = load_image(args.image_path[0], model.image_size)
+
+        transformed_images = transform_one_image(image_array, PREDICT_OPS)
         transformed_image = next(
             (img for img, name in transformed_images if name == "crop_blur"), None
         )
 
-        model = load_model_from_zip()
         prediction = model.predict(
             np.array([transformed_image.astype(np.uint8)]),
         )
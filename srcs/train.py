@@ -1,12 +1,50 @@
 import argparse
-import tensorflow as tf
-from utils.augmentation import augment_dataset
-from utils.hyperparams import IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE
-from utils.build_model import build_model
-from utils.train_model import train_model
-from utils.parsing.model import save_to_zip
-from utils.cache import tf_cache
-from utils.transforms import transform_dataset
+import contextlib
+import attrs
+from pathlib import Path
+from utils.hyperparams import (
+    Hyperparams,
+    add_hyperparams_arguments,
+    hyperparams_from_args,
+)
+from utils.parsing.model import DATASET_MODES, save_to_zip
+from utils.cache import tf_cache, PersistentCache
+from utils.export import is_export, load_export, read_index
+from utils.images import list_class_names
+from utils.inference import LITE_VARIANTS
+from utils.profiling import add_profile_argument, profiling, stage
+
+
+def resolve_hyperparams(args: argparse.Namespace) -> Hyperparams:
+    """
+    Resolve the hyperparameters from the arguments, and tune them if asked.
+
+    Exported datasets keep the resolution they were exported at.
+    """
+    hyperparams = hyperparams_from_args(args)
+    image_sizes = [(side, side) for side in args.tune_image_sizes or []] or None
+    if is_export(args.dataset_path):
+        index = read_index(args.dataset_path)
+        height, width = index["shape"][:2]
+        hyperparams = attrs.evolve(hyperparams, img_height=height, img_width=width)
+        num_classes = len(index["class_names"])
+        image_sizes = None
+    else:
+        num_classes = len(list_class_names(args.dataset_path))
+
+    if args.auto_tune:
+        from utils.autotune import tune
+
+        print("⏳ Measuring training throughput...")
+        hyperparams = tune(
+            hyperparams,
+            num_classes,
+            args.tune_batch_sizes,
+            image_sizes,
+            jit_compile=True if args.jit_compile else "auto",
+        )
+    print(f"➡️  {hyperparams}")
+    return hyperparams
 
 
 def main() -> None:
@@ -19,76 +57,252 @@ def main() -> None:
     os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("dataset_path", help="The path to the dataset directory.")
+    parser.add_argument(
+        "dataset_path",
+        help="The path to the dataset directory, of images or exported with "
+        "--format tfrecord/npy",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes transforming images (1 disables the pool), "
+        "also used as the number of augmentation threads",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the balancing augmentations (random by default)",
+    )
+    # Online augmentation draws fresh augmentations, nothing can be replayed
+    augmentation = parser.add_mutually_exclusive_group()
+    augmentation.add_argument(
+        "--augmentation-manifest",
+        default=None,
+        help="Replay the augmentations listed in this manifest, or write it if it "
+        "does not exist, instead of caching augmented images",
+    )
+    augmentation.add_argument(
+        "--online-augmentation",
+        action="store_true",
+        help="Balance classes by resampling and augment every batch inside the "
+        "input pipeline, with fresh augmentations each epoch and no pre-pass",
+    )
+    parser.add_argument(
+        "--save-datasets",
+        choices=DATASET_MODES,
+        default="embed",
+        help="Embed the datasets in model.zip as JPEG images, only reference "
+        "their source images in a manifest, or leave them out",
+    )
+    parser.add_argument(
+        "--tflite",
+        nargs="+",
+        choices=LITE_VARIANTS,
+        default=[],
+        help="TFLite flatbuffers to export in model.zip for predict.py --backend "
+        "tflite: unquantized, float16 or int8 post-training quantized (none by "
+        "default)",
+    )
+    parser.add_argument(
+        "--mixed-precision",
+        action="store_true",
+        help="Train in bfloat16 with float32 weights where the hardware supports "
+        "it (the saved model stays float32)",
+    )
+    parser.add_argument(
+        "--jit-compile",
+        action="store_true",
+        help="Compile the training step with XLA",
+    )
+    parser.add_argument(
+        "--steps-per-execution",
+        type=int,
+        default=1,
+        help="Number of batches run per call into the training step",
+    )
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help="Measure training throughput at every --tune-batch-sizes (and "
+        "--tune-image-sizes) and train with the fastest that fits in memory",
+    )
+    parser.add_argument(
+        "--tune-batch-sizes",
+        type=int,
+        nargs="+",
+        default=[16, 32, 64, 128],
+        help="Candidate batch sizes of --auto-tune",
+    )
+    parser.add_argument(
+        "--tune-image-sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Candidate square resolutions of --auto-tune (only the configured "
+        "one by default: smaller ones are faster but less accurate)",
+    )
+    add_hyperparams_arguments(parser)
+    add_profile_argument(parser)
     args = parser.parse_args()
 
+    # Imported once the arguments are valid, so --help stays instant
+    import tensorflow as tf
+    from utils.augmentation import augment_dataset, augment_dataset_online
+    from utils.build_model import build_model
+    from utils.inference import convert_to_tflite
+    from utils.train_model import enable_mixed_precision, to_float32, train_model
+    from utils.split import listing_labels, split_dataset, split_manifest
+    from utils.transforms import transform_dataset, transformation_cache_key
+
+    # Closed after the except clause, so a failed run still saves its profile
+    profile = contextlib.ExitStack()
+    profile.enter_context(profiling(args.profile))
     try:
+        mixed_precision = args.mixed_precision and enable_mixed_precision()
+        stage("hyperparams")
+        hyperparams = resolve_hyperparams(args)
+
         print("⏳ Loading original dataset...")
-        dataset = tf.keras.utils.image_dataset_from_directory(
-            directory=args.dataset_path,
-            labels="inferred",
-            label_mode="int",
-            image_size=(IMG_HEIGHT, IMG_WIDTH),
-            batch_size=None,
-        )
+        stage("load")
+        if is_export(args.dataset_path):
+            dataset = load_export(args.dataset_path)
+            labels = dataset.labels
+            file_paths = None
+        else:
+            dataset = tf.keras.utils.image_dataset_from_directory(
+                directory=args.dataset_path,
+                labels="inferred",
+                label_mode="int",
+                # The classes counted by resolve_hyperparams
+                class_names=list_class_names(args.dataset_path),
+                image_size=hyperparams.image_size,
+                batch_size=None,
+                # Same order on every iteration: splits are taken by position
+                shuffle=False,
+            )
+            labels = listing_labels(
+                dataset.file_paths, args.dataset_path, dataset.class_names
+            )
+            file_paths = [str(Path(path).resolve()) for path in dataset.file_paths]
         print("✅ Original dataset loaded.")
         class_names = dataset.class_names
 
+        ops = ["hull_xor_fill", "remove_background", "crop_blur"]
+
         with tf_cache() as cache_dirs:
-            dataset = transform_dataset(
-                dataset,
-                ["hull_xor_fill", "remove_background", "crop_blur"],
-                cache_dirs.transformation,
-            )
+            if getattr(dataset, "ops", None) == ops:
+                print("✅ Dataset already transformed.")
+            else:
+                persistent_cache = PersistentCache()
+                cache_key = transformation_cache_key(
+                    dataset.file_paths, ops, hyperparams.image_size
+                )
+                if persistent_cache.is_complete(cache_key):
+                    print("✅ Reusing cached transformations.")
+                dataset = transform_dataset(
+                    dataset,
+                    ops,
+                    persistent_cache.path(cache_key),
+                    workers=args.workers,
+                    # Trimmed once the new entry is on disk, so it counts
+                    on_cached=lambda: persistent_cache.evict(keep=cache_key),
+                )
 
             # Split into train (70%), val (20%), test (10%)
             print("⏳ Splitting dataset...")
-            train_dataset, remaining_dataset = tf.keras.utils.split_dataset(
-                dataset, left_size=0.7, shuffle=True, seed=42
+            stage("split")
+            train_dataset, remaining_dataset = split_dataset(
+                dataset, labels, left_size=0.7, seed=42
+            )
+            validation_dataset, test_dataset = split_dataset(
+                remaining_dataset, remaining_dataset.labels, left_size=0.67, seed=42
             )
-            validation_dataset, test_dataset = tf.keras.utils.split_dataset(
-                remaining_dataset, left_size=0.67, shuffle=True, seed=42
+            manifest = split_manifest(
+                str(Path(args.dataset_path).resolve()),
+                {
+                    "train": train_dataset,
+                    "validation": validation_dataset,
+                    "test": test_dataset,
+                },
+                file_paths=file_paths,
+                ops=ops,
+                augmentation_manifest=args.augmentation_manifest,
+                image_size=list(hyperparams.image_size),
             )
 
-            train_dataset.class_names = class_names
-            train_dataset = augment_dataset(train_dataset, cache_dirs.augmentation)
-            train_dataset = train_dataset.shuffle(10_000, reshuffle_each_iteration=True)
+            stage("augment")
+            if args.online_augmentation:
+                train_images = int(train_dataset.cardinality())
+                train_dataset = augment_dataset_online(
+                    train_dataset, hyperparams.batch_size, seed=args.seed
+                )
+            else:
+                train_dataset = augment_dataset(
+                    train_dataset,
+                    cache_dirs.augmentation,
+                    workers=args.workers,
+                    seed=args.seed,
+                    manifest_path=args.augmentation_manifest,
+                )
+                train_images = int(train_dataset.cardinality())
+                train_dataset = train_dataset.shuffle(
+                    10_000, reshuffle_each_iteration=True
+                ).batch(hyperparams.batch_size)
 
-            train_dataset = train_dataset.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+            train_dataset = train_dataset.prefetch(tf.data.AUTOTUNE)
 
             validation_dataset = (
                 validation_dataset.cache(filename=cache_dirs.validation)
-                .batch(BATCH_SIZE)
+                .batch(hyperparams.batch_size)
                 .prefetch(tf.data.AUTOTUNE)
             )
 
             test_dataset = (
                 test_dataset.cache(filename=cache_dirs.test)
-                .batch(BATCH_SIZE)
+                .batch(hyperparams.batch_size)
                 .prefetch(tf.data.AUTOTUNE)
             )
 
-            # Force evaluation to fill the cache
-            for _ in validation_dataset.as_numpy_iterator():
-                pass
-            for _ in test_dataset.as_numpy_iterator():
-                pass
-
-            model = build_model()
+            stage("train")
+            model = build_model(hyperparams, len(class_names))
             model.class_names = class_names
             train_model(
                 model,
                 train_dataset,
                 validation_dataset,
                 test_dataset,
+                hyperparams,
+                jit_compile=True if args.jit_compile else "auto",
+                steps_per_execution=args.steps_per_execution,
+                images_per_epoch=train_images if train_images > 0 else None,
             )
+            if mixed_precision:
+                model = to_float32(model)
+
+            stage("tflite")
+            lite_models = {}
+            for variant in args.tflite:
+                print(f"⏳ Exporting {variant} TFLite model...")
+                # Calibrated on validation images, which are already cached
+                lite_models[variant] = convert_to_tflite(
+                    model, variant, validation_dataset.unbatch()
+                )
+            if lite_models:
+                print("✅ TFLite models exported.")
 
             print("⏳ Saving model and datasets to model.zip...")
+            stage("save")
             save_to_zip(
                 model,
                 train_dataset,
                 validation_dataset,
                 test_dataset,
+                datasets=args.save_datasets,
+                manifest=manifest,
+                workers=args.workers,
+                lite_models=lite_models,
             )
             print("✅ Model and datasets saved to model.zip")
     except Exception as e:
@@ -96,6 +310,8 @@ def main() -> None:
             f"An error occurred: {e}",
         )
         return
+    finally:
+        profile.close()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,14 @@
-from .base import Transformation
+from .base import Transformation, BatchTransformation
+from .context import OpContext
 from .registry import register, build, available_ops
 from . import ops
 
-__all__ = ["Transformation", "register", "build", "available_ops", "ops"]
+__all__ = [
+    "Transformation",
+    "BatchTransformation",
+    "OpContext",
+    "register",
+    "build",
+    "available_ops",
+    "ops",
+]
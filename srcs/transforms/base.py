@@ -1,8 +1,13 @@
-from typing import Protocol, Dict, Any
+from typing import Protocol, List
 import numpy as np
+from .context import OpContext
 
 
 class Transformation(Protocol):
     name: str
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray: ...
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray: ...
+
+
+class BatchTransformation(Transformation, Protocol):
+    def apply_batch(self, imgs: np.ndarray, ctxs: List[OpContext]) -> np.ndarray: ...
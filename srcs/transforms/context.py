@@ -0,0 +1,52 @@
+from typing import Dict, List, Optional
+import attrs
+import numpy as np
+
+# Result of an op for each Lab channel ("l", "a" and "b")
+Planes = Dict[str, np.ndarray]
+
+
+@attrs.define(slots=True, eq=False)
+class OpContext:
+    """
+    Intermediate results of the ops on one image.
+
+    Every image gets its own context and ops keep no other state, so images
+    can go through the ops concurrently. A field stays None until the op
+    writing it has run, and goes back to None once no later op reads it.
+    Masks are uint8 arrays of 0 and 255.
+    """
+
+    gaussian_blur: Optional[np.ndarray] = None
+    lab: Optional[Planes] = None
+    mask: Optional[Planes] = None
+    fill_holes: Optional[Planes] = None
+    analyse_results: Optional[Dict[str, Dict[str, float]]] = None
+    # Analysis images and observation labels, from the PlantCV engine only
+    analyse: Optional[Planes] = None
+    analyse_value: Optional[Dict[str, str]] = None
+    # Lab channel whose mask outlines the leaf best
+    selected_mask: Optional[str] = None
+    veins: Optional[np.ndarray] = None
+    # Selected mask with the convex hulls of its contours filled
+    corrected_mask: Optional[np.ndarray] = None
+    remove_background: Optional[np.ndarray] = None
+    # Image returned by each op, by op name, and the "original" image
+    images: Dict[str, np.ndarray] = attrs.field(factory=dict)
+
+    def computed(self) -> List[str]:
+        """
+        Names of the op results set so far.
+        """
+        return [
+            field.name
+            for field in attrs.fields(OpContext)
+            if field.name != "images" and getattr(self, field.name) is not None
+        ]
+
+    def release(self, names: List[str]) -> None:
+        """
+        Drop op results no longer needed, to free their memory.
+        """
+        for name in names:
+            setattr(self, name, None)
@@ -1,29 +1,115 @@
+import threading
 import numpy as np
-from plantcv import plantcv as pcv  # type: ignore
-from typing import Dict, Any
+import cv2
+from typing import Dict
+from ..context import OpContext
 from ..registry import register
 
 
+ENGINES = ("moments", "plantcv")
+
+# PlantCV records observations in the process-wide `pcv.outputs`
+_PLANTCV_LOCK = threading.Lock()
+
+# Label of the observations of the PlantCV engine
+SAMPLE_LABEL = "leaf"
+
+
+def shape_statistics(mask: np.ndarray) -> Dict[str, float]:
+    """
+    Measure the object of a binary mask from its contours and moments.
+
+    Computes the same values as `pcv.analyze.size(img, mask, n_labels=1)`
+    reports for area, perimeter, width, height and center of mass, without
+    drawing the analysis image or recording `pcv.outputs` observations.
+
+    Args:
+        mask: Binary mask (0 or 255)
+
+    Returns:
+        Dictionary of shape statistics
+    """
+    stats = {
+        "area": 0,
+        "perimeter": 0,
+        "width": 0,
+        "height": 0,
+        "centroid_x": 0,
+        "centroid_y": 0,
+    }
+
+    # PlantCV only reads 255 as foreground when the mask holds both 0 and 255
+    if not (mask.min() == 0 and mask.max() == 255):
+        return stats
+    submask = cv2.compare(mask, 255, cv2.CMP_EQ)
+
+    contours, hierarchy = cv2.findContours(
+        submask, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE
+    )
+    # Group every contour but the innermost holes into a single object
+    kept = [
+        contour
+        for contour, (_, _, child, parent) in zip(contours, hierarchy[0])
+        if not (child == -1 and parent > -1)
+    ]
+    obj = np.vstack(kept) if kept else np.array([], dtype=np.int32)
+    if len(obj) <= 5:
+        return stats
+
+    m = cv2.moments(submask, binaryImage=True)
+    _, _, width, height = cv2.boundingRect(obj)
+    stats.update(
+        area=m["m00"],
+        perimeter=cv2.arcLength(obj, closed=True),
+        width=width,
+        height=height,
+        centroid_x=m["m10"] / m["m00"],
+        centroid_y=m["m01"] / m["m00"],
+    )
+    return stats
+
+
 @register("analyse")
 class Analyse:
     name = "analyse"
 
-    def __init__(self) -> None: ...
+    def __init__(self, engine: str = "moments") -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown analyse engine {engine}, use one of {ENGINES}")
+        self.engine = engine
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "mask" not in ctx:
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.mask is None:
             raise Exception("OtsuMask has to be called before Analyse!")
-        masks: Dict[str, np.ndarray] = ctx["mask"]
-        pcv.params.sample_label = "leaf"
-        ctx["analyse"] = {}
-        ctx["analyse_value"] = {}
-        ctx["analyse_results"] = {}  # Store results directly in context
+        if self.engine == "plantcv":
+            with _PLANTCV_LOCK:
+                return self._apply_plantcv(img, ctx)
+
+        ctx.analyse_results = {
+            channel: shape_statistics(mask) for channel, mask in ctx.mask.items()
+        }
+        return img
+
+    def _apply_plantcv(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        """
+        Measure and draw the masks with PlantCV, under `_PLANTCV_LOCK`.
+        """
+        from plantcv import plantcv as pcv  # type: ignore
+
+        assert ctx.mask is not None
+        ctx.analyse = {}
+        ctx.analyse_value = {}
+        ctx.analyse_results = {}
 
-        for i, (channel, mask) in enumerate(masks.items(), start=1):
-            label = f"{pcv.params.sample_label}_{i}"
-            ctx["analyse_value"][channel] = label
+        for i, (channel, mask) in enumerate(ctx.mask.items(), start=1):
+            label = f"{SAMPLE_LABEL}_{i}"
+            ctx.analyse_value[channel] = label
 
-            analysis_result = pcv.analyze.size(img, mask, n_labels=1)
+            # Observations of previous images must not be read back
+            pcv.outputs.clear()
+            analysis_result = pcv.analyze.size(
+                img, mask, n_labels=1, label=SAMPLE_LABEL
+            )
 
             obs = pcv.outputs.observations
 
@@ -36,7 +122,7 @@ class Analyse:
                 centroid_x = obs[current_obs_key]["center_of_mass"]["value"][0]
                 centroid_y = obs[current_obs_key]["center_of_mass"]["value"][1]
 
-                ctx["analyse_results"][channel] = {
+                ctx.analyse_results[channel] = {
                     "area": area_val,
                     "perimeter": perimeter_val,
                     "width": width_val,
@@ -46,7 +132,7 @@ class Analyse:
                 }
             else:
                 print(f"Warning: No observations found for channel {channel}")
-                ctx["analyse_results"][channel] = {
+                ctx.analyse_results[channel] = {
                     "area": 0,
                     "perimeter": 0,
                     "width": 0,
@@ -55,5 +141,6 @@ class Analyse:
                     "centroid_y": 0,
                 }
 
-            ctx["analyse"][channel] = analysis_result
+            ctx.analyse[channel] = analysis_result
+        pcv.outputs.clear()
         return img
@@ -1,8 +1,56 @@
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, List, Optional
+from ..context import OpContext
 from ..registry import register
 import cv2
-from utils.hyperparams import IMG_HEIGHT, IMG_WIDTH
+
+
+def crop_boxes(
+    stats: List[Dict[str, float]], height: int, width: int, margin: int
+) -> np.ndarray:
+    """
+    Boxes around the leaves of a batch, from their shape statistics.
+
+    Args:
+        stats: Statistics of the selected mask of every image, from `Analyse`
+        height: Image height
+        width: Image width
+        margin: Pixels added on every side of the leaf
+
+    Returns:
+        (N, 4) int array of x1, y1, x2, y2, clipped to the image
+    """
+    # Truncated like int(), the statistics are never negative
+    values = np.array(
+        [[s["centroid_x"], s["centroid_y"], s["width"], s["height"]] for s in stats]
+    ).astype(np.int64)
+    centers, sizes = values[:, :2], values[:, 2:]
+    half_sizes = sizes // 2 + margin
+    low = np.maximum(centers - half_sizes, 0)
+    high = np.minimum(centers + half_sizes, [width, height])
+    return np.hstack([low, high])
+
+
+def crop_and_resize(
+    imgs: np.ndarray, boxes: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Crop every image of a batch to its box and resize it back to the image size.
+
+    Args:
+        imgs: (N, H, W, C) images
+        boxes: (N, 4) boxes from `crop_boxes`
+        out: Array of the shape and dtype of `imgs` to write to, allocated if None
+
+    Returns:
+        (N, H, W, C) cropped images
+    """
+    h, w = imgs.shape[1:3]
+    if out is None:
+        out = np.empty_like(imgs)
+    for img, (x1, y1, x2, y2), dst in zip(imgs, boxes, out):
+        cv2.resize(img[y1:y2, x1:x2], (w, h), dst=dst, interpolation=cv2.INTER_AREA)
+    return out
 
 
 @register("crop")
@@ -12,35 +60,21 @@ class Crop:
     def __init__(self, margin: int = 5) -> None:
         self.margin = margin
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        h, w = img.shape[:2]
-
-        if "selected_mask" not in ctx or "analyse_results" not in ctx:
+    def _stats(self, ctxs: List[OpContext]) -> List[Dict[str, float]]:
+        if any(
+            ctx.selected_mask is None or ctx.analyse_results is None for ctx in ctxs
+        ):
             raise ValueError(
                 "Crop operation requires selected_mask and analyse_results in context"
             )
+        return [ctx.analyse_results[ctx.selected_mask] for ctx in ctxs]
 
-        selected_mask = ctx["selected_mask"]
-        mask_data = ctx["analyse_results"][selected_mask]
-
-        center_x = int(mask_data["centroid_x"])
-        center_y = int(mask_data["centroid_y"])
-        mask_width = int(mask_data["width"])
-        mask_height = int(mask_data["height"])
-
-        half_width = (mask_width // 2) + self.margin
-        half_height = (mask_height // 2) + self.margin
-
-        x1 = max(0, center_x - half_width)
-        y1 = max(0, center_y - half_height)
-        x2 = min(w, center_x + half_width)
-        y2 = min(h, center_y + half_height)
-
-        cropped_img = img[y1:y2, x1:x2]
-        resized_img = cv2.resize(
-            cropped_img,
-            (IMG_HEIGHT, IMG_WIDTH),
-            interpolation=cv2.INTER_AREA,
-        )
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        h, w = img.shape[:2]
+        boxes = crop_boxes(self._stats([ctx]), h, w, self.margin)
+        # Resized back to the input size, whatever the configured resolution
+        return crop_and_resize(img[np.newaxis], boxes)[0]
 
-        return resized_img
+    def apply_batch(self, imgs: np.ndarray, ctxs: List[OpContext]) -> np.ndarray:
+        h, w = imgs.shape[1:3]
+        return crop_and_resize(imgs, crop_boxes(self._stats(ctxs), h, w, self.margin))
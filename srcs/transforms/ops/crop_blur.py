@@ -1,7 +1,8 @@
 import numpy as np
-from typing import Dict, Any
+import cv2
+from typing import List
+from ..context import OpContext
 from ..registry import register
-from plantcv import plantcv as pcv
 
 
 @register("crop_blur")
@@ -11,11 +12,18 @@ class CropBlur:
     def __init__(self, blur_kernel: int = 7) -> None:
         self.blur_kernel = blur_kernel
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        kernel_size = (
-            self.blur_kernel if self.blur_kernel % 2 == 1 else self.blur_kernel + 1
-        )
+    @property
+    def kernel_size(self) -> int:
+        return self.blur_kernel if self.blur_kernel % 2 == 1 else self.blur_kernel + 1
 
-        blurred_img = pcv.gaussian_blur(img, (kernel_size, kernel_size))
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        kernel_size = self.kernel_size
+        return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
 
-        return blurred_img
+    def apply_batch(self, imgs: np.ndarray, ctxs: List[OpContext]) -> np.ndarray:
+        kernel_size = self.kernel_size
+        # Blurred one image at a time, a blur of the stacked images would bleed
+        out = np.empty_like(imgs)
+        for img, dst in zip(imgs, out):
+            cv2.GaussianBlur(img, (kernel_size, kernel_size), 0, dst=dst)
+        return out
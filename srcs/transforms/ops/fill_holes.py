@@ -1,20 +1,40 @@
 import numpy as np
-from plantcv import plantcv as pcv  # type: ignore
-from typing import Dict, Any
+import cv2
+from ..context import OpContext
 from ..registry import register
 
 
+def fill_holes(mask: np.ndarray) -> np.ndarray:
+    """
+    Fill the holes of a binary mask, like `pcv.fill_holes`.
+
+    The background reachable from the border (4-connected, as in
+    `scipy.ndimage.binary_fill_holes`) is flood filled from a padding ring,
+    everything else is foreground.
+
+    Args:
+        mask: uint8 mask of 0 and 255
+
+    Returns:
+        uint8 mask of 0 and 255 without holes
+    """
+    background = cv2.copyMakeBorder(
+        cv2.compare(mask, 0, cv2.CMP_EQ), 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=255
+    )
+    cv2.floodFill(background, None, (0, 0), 1, flags=4)
+    return cv2.compare(background[1:-1, 1:-1], 1, cv2.CMP_NE)
+
+
 @register("fill_holes")
 class FillHoles:
     name = "fill_holes"
 
     def __init__(self) -> None: ...
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "mask" not in ctx:
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.mask is None:
             raise Exception("OtsuMask has to be called before FillHoles!")
-        masks: Dict[str, np.ndarray] = ctx["mask"]
-        ctx["fill_holes"] = {}
-        for channel, _img in masks.items():
-            ctx["fill_holes"][channel] = pcv.fill_holes(_img)
+        ctx.fill_holes = {
+            channel: fill_holes(_img) for channel, _img in ctx.mask.items()
+        }
         return img
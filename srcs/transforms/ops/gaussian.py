@@ -1,6 +1,6 @@
 import numpy as np
-from plantcv import plantcv as pcv  # type: ignore
-from typing import Dict, Any
+import cv2
+from ..context import OpContext
 from ..registry import register
 
 
@@ -11,10 +11,11 @@ class GaussianBlur:
     def __init__(self, ksize: int = 5) -> None:
         self.ksize = (ksize, ksize)
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if ctx.keys() != set(["_images"]):
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.computed():
             raise ValueError(
                 "Gaussian blur requires be called right after image loading"
             )
-        ctx["gaussian_blur"] = pcv.gaussian_blur(img=img, ksize=self.ksize)
+        # Same as pcv.gaussian_blur, sigma derived from the kernel size
+        ctx.gaussian_blur = cv2.GaussianBlur(img, self.ksize, 0)
         return img
@@ -1,48 +1,56 @@
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import List
+from ..context import OpContext
 from ..registry import register
 
 
-@register("hull_xor_fill")
-class HullXorFill:
-    name = "hull_xor_fill"
-
-    def __init__(self) -> None: ...
-
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "mask" not in ctx or "selected_mask" not in ctx:
-            raise Exception("SelectMask has to be called before HullXorFill!")
-
-        selected_channel: str = ctx["selected_mask"]
-        original_mask: np.ndarray = ctx["mask"][selected_channel]
+def fill_hulls(mask: np.ndarray) -> bool:
+    """
+    Fill the convex hull of every outer contour of a mask, in place.
 
-        original_dtype = original_mask.dtype
-        mask_uint8 = original_mask.astype(np.uint8)
+    The filled hulls cover the mask, so the result is the mask ORed with
+    the XOR of the hulls and the mask, without computing either.
 
-        contours, _ = cv2.findContours(
-            mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
+    Args:
+        mask: uint8 mask of 0 and 255
 
-        if not contours:
-            raise Exception(f"No contours found in selected mask '{selected_channel}'")
+    Returns:
+        False if the mask has no contour
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        cv2.drawContours(mask, [cv2.convexHull(contour)], 0, 255, cv2.FILLED)
+    return bool(contours)
 
-        hull_mask = np.zeros_like(mask_uint8)
 
-        for contour in contours:
-            hull = cv2.convexHull(contour)
-            cv2.drawContours(hull_mask, [hull], 0, 255, cv2.FILLED)
+@register("hull_xor_fill")
+class HullXorFill:
+    name = "hull_xor_fill"
 
-        xor_result = cv2.bitwise_xor(hull_mask, mask_uint8)
+    def __init__(self) -> None: ...
 
-        corrected_mask = cv2.bitwise_or(mask_uint8, xor_result)
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.mask is None or ctx.selected_mask is None:
+            raise Exception("SelectMask has to be called before HullXorFill!")
 
-        corrected_mask = corrected_mask.astype(original_dtype)
-        hull_mask = hull_mask.astype(original_dtype)
-        xor_result = xor_result.astype(original_dtype)
+        corrected_mask = ctx.mask[ctx.selected_mask].copy()
+        if not fill_hulls(corrected_mask):
+            raise Exception(f"No contours found in selected mask '{ctx.selected_mask}'")
+        ctx.corrected_mask = corrected_mask
+        return img
 
-        ctx["corrected_mask"] = corrected_mask
-        ctx["hull_mask"] = hull_mask
-        ctx["hull_xor_result"] = xor_result
+    def apply_batch(self, imgs: np.ndarray, ctxs: List[OpContext]) -> np.ndarray:
+        if any(ctx.mask is None or ctx.selected_mask is None for ctx in ctxs):
+            raise Exception("SelectMask has to be called before HullXorFill!")
 
-        return img
+        # The corrected masks of the chunk share a single allocation
+        corrected_masks = np.stack([ctx.mask[ctx.selected_mask] for ctx in ctxs])
+        for ctx, corrected_mask in zip(ctxs, corrected_masks):
+            if not fill_hulls(corrected_mask):
+                raise Exception(
+                    f"No contours found in selected mask '{ctx.selected_mask}'"
+                )
+        for ctx, corrected_mask in zip(ctxs, corrected_masks):
+            ctx.corrected_mask = corrected_mask
+        return imgs
@@ -1,9 +1,28 @@
 import numpy as np
-from typing import Dict, Any
-from plantcv import plantcv as pcv  # type: ignore
+from ..context import OpContext
 from ..registry import register
 
 
+def apply_mask(img: np.ndarray, mask: np.ndarray, mask_color: str) -> np.ndarray:
+    """
+    Paint the background of an image, like `pcv.apply_mask`.
+
+    Args:
+        img: Image to mask
+        mask: Binary mask, 0 on the background
+        mask_color: "white" or "black"
+
+    Returns:
+        Masked copy of the image
+    """
+    colors = {"WHITE": 255, "BLACK": 0}
+    if mask_color.upper() not in colors:
+        raise ValueError(f'Mask Color {mask_color} is not "white" or "black"!')
+    masked_img = img.copy()
+    masked_img[mask == 0] = colors[mask_color.upper()]
+    return masked_img
+
+
 @register("remove_background")
 class RemoveBackground:
     name = "remove_background"
@@ -11,20 +30,19 @@ class RemoveBackground:
     def __init__(self, mask_color: str = "white") -> None:
         self.mask_color = mask_color
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "mask" not in ctx or "selected_mask" not in ctx:
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.mask is None or ctx.selected_mask is None:
             raise Exception("SelectMask has to be called before RemoveBackground!")
-        selected_channel: str = ctx["selected_mask"]
         mask = (
-            ctx["mask"][selected_channel]
-            if "corrected_mask" not in ctx
-            else ctx["corrected_mask"]
+            ctx.mask[ctx.selected_mask]
+            if ctx.corrected_mask is None
+            else ctx.corrected_mask
         )
         if img.shape[:2] != mask.shape[:2]:
             raise ValueError(
                 "Cannot remove background from image which has been resized.",
                 "Please adjust the order of operations.",
             )
-        masked_img = pcv.apply_mask(img=img, mask=mask, mask_color=self.mask_color)
-        ctx["remove_background"] = masked_img
+        masked_img = apply_mask(img, mask, self.mask_color)
+        ctx.remove_background = masked_img
         return masked_img
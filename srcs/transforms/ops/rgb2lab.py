@@ -1,19 +1,52 @@
 import numpy as np
-from plantcv import plantcv as pcv  # type: ignore
-from typing import Dict, Any
+import cv2
+from typing import List
+from ..context import OpContext
 from ..registry import register
 
 
+def rgb2lab_batch(imgs: np.ndarray) -> np.ndarray:
+    """
+    Convert a batch of images to Lab with a single colour conversion.
+
+    Matches `pcv.rgb2gray_lab`, which converts with `COLOR_BGR2LAB`.
+
+    Args:
+        imgs: (N, H, W, 3) uint8 images
+
+    Returns:
+        (3, N, H, W) uint8 array of the l, a and b planes
+    """
+    n, h, w, _ = imgs.shape
+    flat = np.ascontiguousarray(imgs, dtype=np.uint8).reshape(n * h, w, 3)
+    lab = cv2.cvtColor(flat, cv2.COLOR_BGR2LAB).reshape(n, h, w, 3)
+    return np.ascontiguousarray(np.moveaxis(lab, -1, 0))
+
+
 @register("rgb2lab")
 class Rgb2Lab:
     name = "rgb2lab"
 
     def __init__(self) -> None: ...
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "lab" not in ctx:
-            ctx["lab"] = {}
-            _img = img.copy() if "gaussian_blur" not in ctx else ctx["gaussian_blur"]
-            for channel in "lab":
-                ctx["lab"][channel] = pcv.rgb2gray_lab(_img.astype(np.uint8), channel)
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.lab is None:
+            _img = img if ctx.gaussian_blur is None else ctx.gaussian_blur
+            planes = rgb2lab_batch(_img[np.newaxis])
+            ctx.lab = {channel: plane[0] for channel, plane in zip("lab", planes)}
         return img
+
+    def apply_batch(self, imgs: np.ndarray, ctxs: List[OpContext]) -> np.ndarray:
+        todo = [i for i, ctx in enumerate(ctxs) if ctx.lab is None]
+        if not todo:
+            return imgs
+        sources = np.stack(
+            [
+                imgs[i] if ctxs[i].gaussian_blur is None else ctxs[i].gaussian_blur
+                for i in todo
+            ]
+        ).astype(np.uint8)
+        planes = rgb2lab_batch(sources)
+        for j, i in enumerate(todo):
+            ctxs[i].lab = {channel: planes[k, j] for k, channel in enumerate("lab")}
+        return imgs
@@ -1,5 +1,6 @@
 import numpy as np
-from typing import Dict, Any
+from typing import Dict
+from ..context import OpContext
 from ..registry import register
 
 
@@ -20,13 +21,12 @@ class SelectMask:
 
     def __init__(self) -> None: ...
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "analyse" not in ctx or "analyse_results" not in ctx:
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.analyse_results is None:
             raise Exception("Analyse has to be called before SelectMask!")
-        analyse_results: Dict[str, Dict[str, float]] = ctx["analyse_results"]
         scores: Dict[str, float] = {}
 
-        for channel, results in analyse_results.items():
+        for channel, results in ctx.analyse_results.items():
             area: float = results["area"]
             perimeter: float = results["perimeter"]
             compactness: float = calculate_compactness(area, perimeter)
@@ -41,5 +41,5 @@ class SelectMask:
             raise Exception("No valid masks found after analysis!")
 
         best_channel: str = max(scores, key=lambda k: scores[k])
-        ctx["selected_mask"] = best_channel
+        ctx.selected_mask = best_channel
         return img
@@ -1,25 +1,70 @@
 import numpy as np
-from plantcv import plantcv as pcv  # type: ignore
-from typing import Dict, Any
+import cv2
+from ..context import OpContext
 from ..registry import register
+from .remove_background import apply_mask
+
+
+def stdev_filter(gray: np.ndarray, ksize: int) -> np.ndarray:
+    """
+    Standard deviation of every pixel's neighbourhood, like `pcv.stdev_filter`
+    with "nearest" borders.
+
+    Computed from box sums of the values and of their squares instead of one
+    `np.std` call per pixel. The sums give the exact deviation, which `np.std`
+    sometimes rounds just below an integer: the windows with an integer
+    deviation go through `np.std` too, so every pixel matches.
+
+    Args:
+        gray: uint8 image
+        ksize: Side of the square neighbourhood
+
+    Returns:
+        uint8 image of the truncated standard deviations
+    """
+    values = gray.astype(np.float64)
+    size = (ksize, ksize)
+    sums = cv2.boxFilter(
+        values, -1, size, normalize=False, borderType=cv2.BORDER_REPLICATE
+    )
+    squares = cv2.boxFilter(
+        values * values, -1, size, normalize=False, borderType=cv2.BORDER_REPLICATE
+    )
+    n = ksize * ksize
+    # Sums of integers are exact, so is the variance numerator
+    numerator = np.maximum(n * squares - sums * sums, 0)
+    stdev = np.sqrt(numerator) / n
+    texture = stdev.astype(np.uint8)
+
+    integer = np.rint(stdev)
+    ys, xs = np.nonzero((numerator > 0) & ((integer * n) ** 2 == numerator))
+    if len(ys):
+        # Same windows and value order as scipy's generic_filter
+        padded = np.pad(values, ksize // 2, mode="edge")
+        windows = np.lib.stride_tricks.sliding_window_view(padded, size)[ys, xs]
+        texture[ys, xs] = [np.std(window.ravel()) for window in windows]
+    return texture
 
 
 @register("veins")
 class Veins:
     name = "veins"
 
-    def __init__(self) -> None: ...
+    def __init__(self, ksize: int = 5, threshold: int = 9) -> None:
+        self.ksize = ksize
+        self.threshold = threshold
 
-    def apply(self, img: np.ndarray, ctx: Dict[str, Any]) -> np.ndarray:
-        if "lab" not in ctx or "mask" not in ctx:
+    def apply(self, img: np.ndarray, ctx: OpContext) -> np.ndarray:
+        if ctx.lab is None or ctx.mask is None:
             raise Exception("Rgb2Lab and Mask has to be called before Veins!")
-        if "l" not in ctx["lab"]:
+        if "l" not in ctx.lab:
             raise Exception("Lab has to have l channel!")
-        selected_channel: str = ctx["selected_mask"]
-        mask_applied_otsu = pcv.apply_mask(
-            ctx["lab"]["l"], ctx["mask"][selected_channel], "black"
-        )
-        viz = pcv.stdev_filter(img=mask_applied_otsu, ksize=5, borders="nearest")
-        _, masked_img = pcv.threshold.custom_range(viz, [9], [255])
-        ctx["veins"] = masked_img
+        if ctx.selected_mask is None:
+            raise Exception("SelectMask has to be called before Veins!")
+
+        leaf = apply_mask(ctx.lab["l"], ctx.mask[ctx.selected_mask], "black")
+        texture = stdev_filter(leaf, self.ksize)
+        # Same as the masked image of pcv.threshold.custom_range(texture, [9], [255])
+        texture[texture < self.threshold] = 0
+        ctx.veins = texture
         return img
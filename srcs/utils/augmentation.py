@@ -1,16 +1,45 @@
-from typing import List, Dict, Tuple, Generator, Optional
-import tensorflow as tf
+from __future__ import annotations
+
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Generator,
+    Optional,
+    Deque,
+    NamedTuple,
+    TYPE_CHECKING,
+)
+import json
+import math
+import threading
 import albumentations as A
 import cv2
 import numpy as np
 import random
-from .hyperparams import IMG_HEIGHT, IMG_WIDTH
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from .hyperparams import DEFAULTS
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+# Side of the "Crop" augmentation, relative to the image (115 px at 256 px)
+CROP_FRACTION = 115 / 256
 
 
-def augmentations() -> Dict[str, A.BasicTransform]:
+def augmentations(
+    image_size: Tuple[int, int] = DEFAULTS.image_size,
+) -> Dict[str, A.BasicTransform]:
     """
     Returns a dictionary of specific, named augmentations.
+
+    Args:
+        image_size: (height, width) of the images to augment
     """
+    height, width = image_size
     return {
         "Flip": A.HorizontalFlip(p=0.5),
         "Rotate": A.Affine(rotate=(-30, 30), p=0.5, border_mode=cv2.BORDER_REFLECT_101),
@@ -26,9 +55,13 @@ def augmentations() -> Dict[str, A.BasicTransform]:
         ),
         "Crop": A.Compose(
             [
-                A.CenterCrop(height=115, width=115, p=1.0),
+                A.CenterCrop(
+                    height=round(CROP_FRACTION * height),
+                    width=round(CROP_FRACTION * width),
+                    p=1.0,
+                ),
                 # To maintain consistent image size after cropping
-                A.Resize(height=IMG_HEIGHT, width=IMG_WIDTH, p=1.0),
+                A.Resize(height=height, width=width, p=1.0),
             ],
             p=0.5,
         ),
@@ -49,7 +82,7 @@ def augment_image(image: np.ndarray) -> List[Tuple[np.ndarray, Optional[str]]]:
         List of augmented images
     """
 
-    augmentation_dict = augmentations()
+    augmentation_dict = augmentations(image.shape[:2])
     augmented_images = [(image, None)]
 
     for name, augmentation in augmentation_dict.items():
@@ -60,34 +93,100 @@ def augment_image(image: np.ndarray) -> List[Tuple[np.ndarray, Optional[str]]]:
     return augmented_images
 
 
-def create_augmented_generator(
-    dataset: tf.data.Dataset,
-) -> Generator[Tuple[np.ndarray, int], None, None]:
+class Manifest(NamedTuple):
     """
-    Generator that yields augmented images to balance the dataset.
+    Everything needed to regenerate the synthetic samples of a balanced dataset.
+
+    Each sample is (label, source, augmentation, seed), where source is the rank
+    of the source image within its class.
+    """
+
+    class_counts: Dict[int, int]
+    samples: List[Tuple[int, int, str, int]]
+
+
+def save_manifest(manifest: Manifest, path: str | Path) -> None:
+    """
+    Write an augmentation manifest as JSON.
 
     Args:
-        dataset: Original tf.data.Dataset
+        manifest: Manifest to write
+        path: Destination file
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "class_counts": {str(k): v for k, v in manifest.class_counts.items()},
+                "samples": manifest.samples,
+            },
+            f,
+            separators=(",", ":"),
+        )
+
+
+def load_manifest(path: str | Path) -> Manifest:
+    """
+    Read an augmentation manifest written by `save_manifest`.
+
+    Args:
+        path: Manifest file
 
     Returns:
-        Generator yielding tuples of (image, label)
+        Manifest
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return Manifest(
+        class_counts={int(k): v for k, v in data["class_counts"].items()},
+        samples=[tuple(sample) for sample in data["samples"]],
+    )
+
+
+def _class_counts(dataset: tf.data.Dataset) -> Dict[int, int]:
     """
+    Count the samples of every class.
+
+    Only the labels are brought into Python, but the pipeline producing the
+    images still runs: this is a full pass over the dataset.
 
-    # Count the number of samples per class
+    Args:
+        dataset: Original tf.data.Dataset
+
+    Returns:
+        Dictionary mapping each label to its number of samples
+    """
     class_counts: Dict[int, int] = {}
-    for _, label in dataset.as_numpy_iterator():
-        class_counts[label] = class_counts.get(label, 0) + 1
+    labels = dataset.map(lambda _, label: label)
+    for label in labels.as_numpy_iterator():
+        class_counts[int(label)] = class_counts.get(int(label), 0) + 1
+    return class_counts
 
-    max_count = max(class_counts.values())
-    augmentation_list = list(augmentations().items())
 
-    # Yield original samples
-    for image, label in dataset.as_numpy_iterator():
-        yield image, label
+def create_manifest(
+    class_counts: Dict[int, int], class_names: List[str], seed: Optional[int] = None
+) -> Manifest:
+    """
+    Draw the source image, augmentation and seed of every sample needed for balance.
+
+    Sources are identified by their rank within their class rather than their
+    position in the dataset, which stays valid if the dataset reshuffles.
+
+    Args:
+        class_counts: Number of samples of every class
+        class_names: Class name of every label
+        seed: Seed of the draw, None for a random one
+
+    Returns:
+        Manifest of the synthetic samples
+    """
+    rng = random.Random(seed)
+    names = list(augmentations())
+    max_count = max(class_counts.values())
+    samples: List[Tuple[int, int, str, int]] = []
 
-    # Augment each class to match the max count
     for class_label, count in class_counts.items():
-        class_name = dataset.class_names[class_label]
+        class_name = class_names[class_label]
         num_to_generate = max_count - count
         if num_to_generate <= 0:
             print(f"✅ Class {class_name:<15} is already balanced.")
@@ -98,47 +197,296 @@ def create_augmented_generator(
             f"Generating {num_to_generate:<4} new images..."
         )
 
-        class_dataset = dataset.filter(lambda _, label: label == class_label)
-        class_images = list(class_dataset.as_numpy_iterator())
-
         # Randomly apply augmentations to generate new images
         for _ in range(num_to_generate):
-            source_image, _ = random.choice(class_images)
-            _, augmentation = random.choice(augmentation_list)
+            samples.append(
+                (
+                    class_label,
+                    rng.randrange(count),
+                    rng.choice(names),
+                    rng.randrange(2**32),
+                )
+            )
+
+    return Manifest(class_counts=class_counts, samples=samples)
+
+
+# Compose objects of the current thread, they keep random state between calls
+_local = threading.local()
+
+
+def _thread_transforms(image_size: Tuple[int, int]) -> Dict[str, A.Compose]:
+    if not hasattr(_local, "transforms"):
+        _local.transforms = {}
+    if image_size not in _local.transforms:
+        _local.transforms[image_size] = {
+            name: A.Compose([augmentation])
+            for name, augmentation in augmentations(image_size).items()
+        }
+    return _local.transforms[image_size]
+
+
+def _augment_chunk(jobs: List[Tuple[np.ndarray, str, int]]) -> List[np.ndarray]:
+    """
+    Apply the named augmentation of every job, seeded with the job's seed.
+
+    Args:
+        jobs: List of (source image, augmentation name, seed)
+
+    Returns:
+        Augmented images, in job order
+    """
+    augmented = []
+    for image, name, seed in jobs:
+        transform = _thread_transforms(image.shape[:2])[name]
+        transform.set_random_seed(seed)
+        augmented.append(transform(image=image)["image"])
+    return augmented
+
+
+def create_augmented_generator(
+    dataset: tf.data.Dataset,
+    manifest: Manifest,
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> Generator[Tuple[np.ndarray, int], None, None]:
+    """
+    Generator that yields augmented images to balance the dataset.
+
+    One pass over the images yields every original while the manifest samples
+    drawn from it are queued. Queued augmentations are applied by chunk
+    on a pool of threads (OpenCV releases the GIL) and yielded in submission
+    order. Every sample carries its own seed, so the same manifest gives the
+    same images whatever the number of workers.
+
+    Args:
+        dataset: Original tf.data.Dataset
+        manifest: Synthetic samples to generate
+        workers: Number of threads applying augmentations
+        chunk_size: Number of augmentations applied per task
+
+    Returns:
+        Generator yielding tuples of (image, label)
+    """
+
+    plan: Dict[int, Dict[int, List[Tuple[str, int]]]] = {}
+    for label, source, name, seed in manifest.samples:
+        plan.setdefault(label, {}).setdefault(source, []).append((name, seed))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: Deque[Tuple[List[int], Future]] = deque()
+        jobs: List[Tuple[np.ndarray, str, int]] = []
+        labels: List[int] = []
 
-            transform = A.Compose([augmentation])
-            augmented = transform(image=source_image)["image"]
+        def submit() -> None:
+            nonlocal jobs, labels
+            pending.append((labels, pool.submit(_augment_chunk, jobs)))
+            jobs, labels = [], []
 
-            yield augmented, class_label
+        def drain(max_pending: int) -> Generator[Tuple[np.ndarray, int], None, None]:
+            while len(pending) > max_pending:
+                chunk_labels, future = pending.popleft()
+                yield from zip(future.result(), chunk_labels)
+
+        seen: Dict[int, int] = {}
+        for image, label in dataset.as_numpy_iterator():
+            rank = seen.get(int(label), 0)
+            seen[int(label)] = rank + 1
+
+            yield image, label
+            for name, seed in plan.get(int(label), {}).get(rank, []):
+                jobs.append((image, name, seed))
+                labels.append(label)
+                if len(jobs) == chunk_size:
+                    submit()
+            yield from drain(2 * workers)
+
+        if jobs:
+            submit()
+        yield from drain(0)
 
 
 def augment_dataset(
     dataset: tf.data.Dataset,
     cache_path: str | None = ".tf-cache/augmentation/",
+    workers: int = 1,
+    chunk_size: int = 64,
+    seed: Optional[int] = None,
+    manifest_path: str | Path | None = None,
 ) -> tf.data.Dataset:
     """
     Augments the dataset to balance class distributions.
 
+    The class counts come from `dataset.class_counts` when it has them, as
+    the splits of `split_dataset` do. Otherwise they take a label-only pass
+    over the dataset before the pass that yields the images.
+
+    With `manifest_path`, the synthetic samples are described by a manifest
+    (written on the first run, read afterwards) and regenerated lazily on every
+    iteration instead of being cached, so `cache_path` is not used.
+
     Args:
         dataset: Original tf.data.Dataset
+        cache_path: Where to cache the augmented samples
+        workers: Number of threads applying augmentations
+        chunk_size: Number of augmentations applied per task
+        seed: Seed of the sampling and augmentations, None for a random run
+        manifest_path: Manifest to replay, or to create if it does not exist
 
     Returns:
         Augmented tf.data.Dataset
     """
+    import tensorflow as tf
+
+    class_counts = getattr(dataset, "class_counts", None) or _class_counts(dataset)
+    if manifest_path is not None and Path(manifest_path).exists():
+        manifest = load_manifest(manifest_path)
+        # Sources are ranks within their class: any other split of the same
+        # size would replay the wrong images and balance
+        if manifest.class_counts != class_counts:
+            raise ValueError(
+                f"Augmentation manifest {manifest_path} does not match the dataset: "
+                f"class counts {manifest.class_counts} instead of {class_counts}"
+            )
+        print(f"✅ Replaying {len(manifest.samples)} augmentations from manifest.")
+    else:
+        manifest = create_manifest(class_counts, dataset.class_names, seed)
+        if manifest_path is not None:
+            save_manifest(manifest, manifest_path)
 
     augmented_dataset = tf.data.Dataset.from_generator(
-        lambda: create_augmented_generator(dataset),
+        lambda: create_augmented_generator(dataset, manifest, workers, chunk_size),
         output_signature=dataset.element_spec,
-    ).cache(filename=cache_path)
+    )
 
-    # Force evaluation to apply augmentations immediately (and apply cardinality)
-    cardinality = 0
-    for _ in augmented_dataset.as_numpy_iterator():
-        cardinality += 1
+    if manifest_path is None:
+        # Filled during the first real iteration
+        augmented_dataset = augmented_dataset.cache(filename=cache_path)
 
+    cardinality = sum(manifest.class_counts.values()) + len(manifest.samples)
     augmented_dataset = augmented_dataset.apply(
         tf.data.experimental.assert_cardinality(cardinality)
     )
 
     augmented_dataset.class_names = dataset.class_names
     return augmented_dataset
+
+
+def _affine_matrices(
+    batch: tf.Tensor, height: tf.Tensor, width: tf.Tensor
+) -> tf.Tensor:
+    """
+    Draw one random affine matrix per image, around the image center.
+
+    Uses the rotation, shear, scale and translation ranges of `augmentations()`,
+    each component being applied to half of the images.
+
+    Returns:
+        (batch, 3, 3) matrices mapping input to output coordinates
+    """
+    import tensorflow as tf
+
+    def maybe(values: tf.Tensor, identity: float) -> tf.Tensor:
+        keep = tf.random.uniform([batch]) < 0.5
+        return tf.where(keep, values, tf.fill([batch], identity))
+
+    angle = maybe(tf.random.uniform([batch], -30.0, 30.0), 0.0) * math.pi / 180
+    shear = tf.tan(maybe(tf.random.uniform([batch], -20.0, 20.0), 0.0) * math.pi / 180)
+    scale = maybe(tf.random.uniform([batch], 0.92, 1.08), 1.0)
+    shift = maybe(tf.random.uniform([batch], -0.1, 0.1), 0.0) * width
+
+    zeros, ones = tf.zeros([batch]), tf.ones([batch])
+    cx, cy = (width - 1) / 2 * ones, (height - 1) / 2 * ones
+    cos, sin = tf.cos(angle), tf.sin(angle)
+
+    def matrix(*rows: List[tf.Tensor]) -> tf.Tensor:
+        return tf.stack([tf.stack(row, axis=-1) for row in rows], axis=1)
+
+    to_origin = matrix([ones, zeros, -cx], [zeros, ones, -cy], [zeros, zeros, ones])
+    rotate = matrix([cos, -sin, zeros], [sin, cos, zeros], [zeros, zeros, ones])
+    shear_x = matrix([ones, shear, zeros], [zeros, ones, zeros], [zeros, zeros, ones])
+    zoom = matrix([scale, zeros, zeros], [zeros, scale, zeros], [zeros, zeros, ones])
+    back = matrix([ones, zeros, cx + shift], [zeros, ones, cy], [zeros, zeros, ones])
+
+    return back @ rotate @ shear_x @ zoom @ to_origin
+
+
+def augment_batch(images: tf.Tensor) -> tf.Tensor:
+    """
+    Randomly flip and warp every image of a batch with vectorized TF ops.
+
+    Args:
+        images: (N, H, W, C) batch of images
+
+    Returns:
+        Augmented batch of the same shape and dtype
+    """
+    import tensorflow as tf
+
+    images = tf.image.random_flip_left_right(images)
+
+    shape = tf.shape(images)
+    height, width = tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32)
+    # The op maps output points to input points, hence the inverse
+    inverse = tf.linalg.inv(_affine_matrices(shape[0], height, width))
+    transforms = tf.reshape(inverse, [-1, 9])[:, :8] / inverse[:, 2:3, 2]
+
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        fill_mode="REFLECT",
+    )
+
+
+def augment_dataset_online(
+    dataset: tf.data.Dataset,
+    batch_size: int,
+    epoch_size: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Balance and augment the dataset on the fly, inside the tf.data pipeline.
+
+    Classes are balanced by rejection resampling an endlessly reshuffled copy
+    of the dataset (the class distribution is estimated online), and every
+    batch is augmented in a parallel `map`. Nothing is computed up front or
+    cached, and each epoch sees fresh augmentations.
+
+    Args:
+        dataset: Original, unbatched tf.data.Dataset
+        batch_size: Number of images per batch
+        epoch_size: Number of images per epoch, defaults to the dataset size
+        seed: Seed of the shuffling and resampling
+
+    Returns:
+        Batched, balanced and augmented tf.data.Dataset
+    """
+    import tensorflow as tf
+
+    num_classes = len(dataset.class_names)
+    if epoch_size is None:
+        epoch_size = int(dataset.cardinality())
+        if epoch_size < 0:
+            raise ValueError("The dataset size is unknown, please give epoch_size")
+
+    balanced = (
+        dataset.shuffle(10_000, seed=seed, reshuffle_each_iteration=True)
+        .repeat()
+        .rejection_resample(
+            class_func=lambda _, label: label,
+            target_dist=[1.0 / num_classes] * num_classes,
+            seed=seed,
+        )
+        .map(lambda _, sample: sample, num_parallel_calls=tf.data.AUTOTUNE)
+        .take(epoch_size)
+    )
+
+    augmented_dataset = balanced.batch(batch_size).map(
+        lambda images, labels: (augment_batch(images), labels),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    augmented_dataset.class_names = dataset.class_names
+    return augmented_dataset
@@ -0,0 +1,169 @@
+import os
+import time
+import attrs
+import numpy as np
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+from .build_model import build_model
+from .hyperparams import Hyperparams
+from .profiling import peak_memory, reset_peak_memory
+
+DEFAULT_BATCH_SIZES = (16, 32, 64, 128)
+
+# Share of the physical memory a candidate may use at its peak
+MEMORY_FRACTION = 0.8
+
+
+class Trial(NamedTuple):
+    image_size: Tuple[int, int]
+    batch_size: int
+    # None if the candidate did not fit in memory
+    images_per_sec: Optional[float]
+    peak_memory: int
+
+
+def _physical_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def measure_throughput(
+    hyperparams: Hyperparams,
+    num_classes: int,
+    jit_compile: Union[bool, str] = "auto",
+    steps: int = 5,
+    warmup: int = 2,
+) -> float:
+    """
+    Time training steps of a fresh model on random images.
+
+    Args:
+        hyperparams: Gives the image size and the batch size to measure
+        num_classes: Number of outputs of the model
+        jit_compile: Compile the training step with XLA
+        steps: Number of timed training steps
+        warmup: Number of untimed steps, which trace and compile the model
+
+    Returns:
+        Images processed per second
+    """
+    import tensorflow as tf
+
+    model = build_model(hyperparams, num_classes)
+    model.compile(
+        optimizer="adam",
+        loss="sparse_categorical_crossentropy",
+        jit_compile=jit_compile,
+    )
+    rng = np.random.default_rng(0)
+    images = rng.integers(
+        0, 256, (hyperparams.batch_size, *hyperparams.image_size, 3)
+    ).astype(np.float32)
+    labels = rng.integers(0, num_classes, hyperparams.batch_size)
+
+    try:
+        for _ in range(warmup):
+            model.train_on_batch(images, labels)
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.train_on_batch(images, labels)
+        elapsed = time.perf_counter() - start
+    finally:
+        del model
+        tf.keras.backend.clear_session()
+    return steps * hyperparams.batch_size / elapsed
+
+
+def _tune_batch_size(
+    hyperparams: Hyperparams,
+    num_classes: int,
+    batch_sizes: Sequence[int],
+    jit_compile: Union[bool, str],
+    budget: int,
+) -> List[Trial]:
+    """
+    Measure increasing batch sizes at one resolution, until one does not fit.
+
+    A batch size is not tried if its peak memory, extrapolated from the
+    previous one, would exceed `budget`: on CPU, running out of memory kills
+    the process instead of raising an error.
+    """
+    import tensorflow as tf
+
+    trials: List[Trial] = []
+    for batch_size in sorted(batch_sizes):
+        candidate = attrs.evolve(hyperparams, batch_size=batch_size)
+        if trials:
+            # Scaling the whole peak overestimates it: the weights do not grow
+            previous = trials[-1]
+            if previous.peak_memory * batch_size // previous.batch_size > budget:
+                trials.append(Trial(candidate.image_size, batch_size, None, 0))
+                break
+
+        reset_peak_memory()
+        try:
+            throughput: Optional[float] = measure_throughput(
+                candidate, num_classes, jit_compile
+            )
+        except tf.errors.ResourceExhaustedError:
+            throughput = None
+        peak = peak_memory()
+        if peak > budget:
+            throughput = None
+        trials.append(Trial(candidate.image_size, batch_size, throughput, peak))
+        print(
+            f"➡️  {candidate.img_height}x{candidate.img_width} batch {batch_size:<4} "
+            + (f"{throughput:.1f} images/sec" if throughput else "does not fit")
+        )
+        if throughput is None:
+            break
+    return trials
+
+
+def tune(
+    hyperparams: Hyperparams,
+    num_classes: int,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+    image_sizes: Optional[Sequence[Tuple[int, int]]] = None,
+    jit_compile: Union[bool, str] = "auto",
+    memory_fraction: float = MEMORY_FRACTION,
+) -> Hyperparams:
+    """
+    Pick the batch size and resolution with the fastest training steps.
+
+    Every candidate is measured on random images, so no data is needed.
+    Candidates whose peak memory exceeds `memory_fraction` of the physical
+    memory are ruled out. Smaller resolutions are always faster but less
+    accurate, so only the configured one is tried unless others are given.
+
+    Args:
+        hyperparams: Configured hyperparameters
+        num_classes: Number of outputs of the model
+        batch_sizes: Candidate batch sizes
+        image_sizes: Candidate (height, width), defaults to the configured one
+        jit_compile: Compile the training step with XLA
+        memory_fraction: Share of the physical memory a candidate may use
+
+    Returns:
+        The configured hyperparameters with the fastest batch size and
+        resolution that fit
+    """
+    budget = int(memory_fraction * _physical_memory())
+    trials: List[Trial] = []
+    for height, width in image_sizes or [hyperparams.image_size]:
+        trials += _tune_batch_size(
+            attrs.evolve(hyperparams, img_height=height, img_width=width),
+            num_classes,
+            batch_sizes,
+            jit_compile,
+            budget,
+        )
+
+    fitting = [trial for trial in trials if trial.images_per_sec is not None]
+    if not fitting:
+        raise ValueError("No candidate batch size fits in memory")
+    best = max(fitting, key=lambda trial: trial.images_per_sec or 0.0)
+    return attrs.evolve(
+        hyperparams,
+        img_height=best.image_size[0],
+        img_width=best.image_size[1],
+        batch_size=best.batch_size,
+    )
@@ -1,15 +1,19 @@
 from tensorflow import keras
 from keras import Sequential, layers
-from .hyperparams import IMG_HEIGHT, IMG_WIDTH, CLASSES
+from .hyperparams import Hyperparams
 
 
-def build_model() -> Sequential:
+def build_model(hyperparams: Hyperparams, num_classes: int) -> Sequential:
     """
     Build the CNN structure here.
+
+    Args:
+        hyperparams: Gives the size of the input images
+        num_classes: Number of outputs, one per class name
     """
     model = keras.Sequential(
         [
-            keras.Input(shape=(IMG_HEIGHT, IMG_WIDTH, 3)),
+            keras.Input(shape=(*hyperparams.image_size, 3)),
             layers.SeparableConv2D(16, (3, 3), activation="relu", padding="same"),
             layers.SeparableConv2D(16, (3, 3), activation="relu", padding="same"),
             layers.MaxPooling2D((2, 2)),
@@ -22,7 +26,8 @@ def build_model() -> Sequential:
             layers.Flatten(),
             layers.Dense(128, activation="relu"),
             layers.Dropout(0.5),
-            layers.Dense(CLASSES, activation="softmax"),
+            # Kept in float32 under mixed precision, for a stable loss
+            layers.Dense(num_classes, activation="softmax", dtype="float32"),
         ]
     )
     return model
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import csv
+import glob
+import json
+import multiprocessing
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from .images import load_image
+from .serving import PREDICT_OPS, rank_predictions
+from .transforms import init_worker, transform_chunk
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def expand_inputs(inputs: List[str]) -> List[Path]:
+    """
+    Expand image paths, directories (searched recursively) and glob patterns.
+
+    Args:
+        inputs: Paths, directories or glob patterns
+
+    Returns:
+        Sorted, de-duplicated list of image files
+    """
+    files: set[Path] = set()
+    for pattern in inputs:
+        for match in glob.glob(pattern, recursive=True) or [pattern]:
+            path = Path(match)
+            if path.is_dir():
+                files.update(
+                    p for p in path.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS
+                )
+            elif path.is_file():
+                files.add(path)
+            else:
+                raise FileNotFoundError(f"{pattern} does not match any file")
+    return sorted(files)
+
+
+def _preprocess_chunk(
+    paths: List[str], image_size: Tuple[int, int]
+) -> Tuple[List[Optional[np.ndarray]], List[Optional[str]], Dict[str, float]]:
+    """
+    Load and transform a chunk of images (runs in a worker process).
+
+    Returns:
+        Tuple of (transformed image or None, error or None, stage seconds)
+    """
+    start = time.perf_counter()
+    images: List[Optional[np.ndarray]] = []
+    errors: List[Optional[str]] = []
+    for path in paths:
+        try:
+            images.append(load_image(path, image_size))
+            errors.append(None)
+        except Exception as e:
+            images.append(None)
+            errors.append(str(e))
+    loaded = time.perf_counter()
+
+    valid = [image for image in images if image is not None]
+    transformed = iter(transform_chunk(valid)) if valid else iter([])
+    images = [next(transformed) if image is not None else None for image in images]
+
+    timings = {"load": loaded - start, "transform": time.perf_counter() - loaded}
+    return images, errors, timings
+
+
+def _preprocessed_chunks(
+    paths: List[str], workers: int, chunk_size: int, image_size: Tuple[int, int]
+) -> Iterator[Tuple[List[str], Tuple[Any, Any, Dict[str, float]]]]:
+    chunks = [paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+    if workers <= 1:
+        init_worker(PREDICT_OPS)
+        for chunk in chunks:
+            yield chunk, _preprocess_chunk(chunk, image_size)
+        return
+
+    # TensorFlow is not fork-safe, workers have to start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    pending: Deque[Tuple[List[str], Future]] = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(PREDICT_OPS,),
+    ) as pool:
+        for chunk in chunks:
+            pending.append(
+                (chunk, pool.submit(_preprocess_chunk, chunk, image_size))
+            )
+            while len(pending) > 2 * workers:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+
+class _Writer:
+    """
+    Write one prediction per row, as CSV or JSON lines depending on the suffix.
+    """
+
+    def __init__(self, path: Path, class_names: List[str]) -> None:
+        self.file = open(path, "w", newline="")
+        self.csv: Optional[Any] = None
+        if path.suffix.lower() == ".csv":
+            self.csv = csv.writer(self.file)
+            header = ["path", "prediction", "confidence", "error"] + class_names
+            self.csv.writerow(header)
+
+    def write(
+        self,
+        path: str,
+        probabilities: Optional[np.ndarray],
+        class_names: List[str],
+        error: Optional[str],
+    ) -> None:
+        ranked = (
+            rank_predictions(probabilities, class_names)
+            if probabilities is not None
+            else None
+        )
+        if self.csv is not None:
+            if ranked is None:
+                self.csv.writerow([path, "", "", error] + [""] * len(class_names))
+            else:
+                self.csv.writerow(
+                    [path, ranked[0]["class"], ranked[0]["probability"], ""]
+                    + [float(p) for p in probabilities]
+                )
+            return
+        row: Dict[str, Any] = {"path": path}
+        if ranked is None:
+            row["error"] = error
+        else:
+            row["predictions"] = ranked
+        self.file.write(json.dumps(row) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def predict_files(
+    model: tf.keras.Model,
+    paths: List[Path],
+    output: Path,
+    batch_size: int,
+    workers: int,
+) -> Dict[str, float]:
+    """
+    Score image files in batches and write their predictions to `output`.
+
+    Images are loaded and transformed by `workers` processes while the model
+    predicts the previous batches in this one.
+
+    Args:
+        model: Trained model with `class_names` and `image_size`
+        paths: Image files to score
+        output: CSV (.csv) or JSON lines (anything else) file to write
+        batch_size: Number of images per model call (and per worker chunk)
+        workers: Number of preprocessing processes (1 runs in-process)
+
+    Returns:
+        Seconds spent per stage, summed over workers for load and transform
+    """
+    timings = {"load": 0.0, "transform": 0.0, "predict": 0.0, "write": 0.0}
+    start = time.perf_counter()
+    writer = _Writer(output, model.class_names)
+
+    try:
+        str_paths = [str(path) for path in paths]
+        for chunk, (images, errors, chunk_timings) in _preprocessed_chunks(
+            str_paths, workers, batch_size, model.image_size
+        ):
+            timings["load"] += chunk_timings["load"]
+            timings["transform"] += chunk_timings["transform"]
+
+            tick = time.perf_counter()
+            valid = [image.astype(np.uint8) for image in images if image is not None]
+            predictions = iter(model.predict_on_batch(np.stack(valid)) if valid else [])
+            timings["predict"] += time.perf_counter() - tick
+
+            tick = time.perf_counter()
+            for path, image, error in zip(chunk, images, errors):
+                probabilities = next(predictions) if image is not None else None
+                writer.write(path, probabilities, model.class_names, error)
+            timings["write"] += time.perf_counter() - tick
+    finally:
+        writer.close()
+
+    timings["total"] = time.perf_counter() - start
+    return timings
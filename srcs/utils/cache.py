@@ -1,15 +1,91 @@
 import contextlib
+import os
+import shutil
 import tempfile
 from pathlib import Path
 from typing import NamedTuple
 
 
+# Upper bound of the persistent cache before least recently used entries go
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+
+class PersistentCache:
+    """
+    Size-bounded on-disk store of tf.data cache files that survives across runs.
+
+    Each entry is a directory named after a content hash, so identical inputs
+    map to the same files. Once an entry has been written, `evict` removes the
+    least recently used others until the store fits in `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".tf-cache/persistent/",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.root = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def is_complete(self, key: str) -> bool:
+        """
+        Whether a previous run has fully written the entry for `key`.
+        """
+        # tf.data only writes the index once the whole dataset has been cached
+        return (self.root / key / ".index").exists()
+
+    def path(self, key: str) -> str:
+        """
+        Get the tf.data cache filename for `key` and mark it as recently used.
+
+        Args:
+            key: Content hash identifying the cached data
+
+        Returns:
+            Filename prefix to pass to `tf.data.Dataset.cache`
+        """
+        entry = self.root / key
+        if entry.exists() and not self.is_complete(key):
+            # Leftovers of an interrupted run, tf.data refuses to resume them
+            shutil.rmtree(entry)
+        entry.mkdir(parents=True, exist_ok=True)
+        os.utime(entry)
+        return entry.resolve().as_posix() + "/"
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Remove least recently used entries until the store fits `max_bytes`.
+
+        Args:
+            keep: Entry that must not be evicted
+        """
+        if not self.root.exists():
+            return
+
+        entries = sorted(
+            (entry for entry in self.root.iterdir() if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        sizes = {
+            entry: sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+            for entry in entries
+        }
+        total = sum(sizes.values())
+
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
 class CacheDirs(NamedTuple):
     """
     Named tuple for cache directories.
     """
 
-    transformation: str
     augmentation: str
     validation: str
     test: str
@@ -20,6 +96,8 @@ def tf_cache(cache_dir: str = ".tf-cache/"):
     """
     Context manager for caching with multiple temporary directories.
 
+    Transformations are not covered here, they live in a `PersistentCache`.
+
     Args:
         cache_dir: Base directory to store cached images.
 
@@ -31,9 +109,6 @@ def tf_cache(cache_dir: str = ".tf-cache/"):
 
     try:
         with contextlib.ExitStack() as stack:
-            transformation_dir = stack.enter_context(
-                tempfile.TemporaryDirectory(dir=path, prefix="transformation")
-            )
             augmentation_dir = stack.enter_context(
                 tempfile.TemporaryDirectory(dir=path, prefix="augmentation")
             )
@@ -44,16 +119,16 @@ def tf_cache(cache_dir: str = ".tf-cache/"):
                 tempfile.TemporaryDirectory(dir=path, prefix="test")
             )
 
-            transformation_path = Path(transformation_dir).resolve()
             augmentation_path = Path(augmentation_dir).resolve()
             validation_path = Path(validation_dir).resolve()
             test_path = Path(test_dir).resolve()
 
             yield CacheDirs(
-                transformation=transformation_path.as_posix() + "/",
                 augmentation=augmentation_path.as_posix() + "/",
                 validation=validation_path.as_posix() + "/",
                 test=test_path.as_posix() + "/",
             )
     finally:
-        path.rmdir()
+        # The directory is shared with the persistent cache, keep it if non empty
+        with contextlib.suppress(OSError):
+            path.rmdir()
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import json
+import numpy as np
+from pathlib import Path
+from tqdm import tqdm
+from typing import Any, Dict, List, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+EXPORT_FORMATS = ("jpg", "tfrecord", "npy")
+INDEX_FILE = "index.json"
+LABELS_FILE = "labels.npy"
+IMAGES_FILE = "images.npy"
+
+# Samples per TFRecord shard, and per block read from a .npy store
+DEFAULT_SHARD_SIZE = 1024
+
+
+def is_export(path: str | Path) -> bool:
+    """
+    Whether `path` holds a dataset written by `export_dataset`.
+    """
+    # The index is written last, so a partial export is not picked up
+    return (Path(path) / INDEX_FILE).exists()
+
+
+def _write_index(
+    directory: Path,
+    fmt: str,
+    labels: List[int],
+    class_names: List[str],
+    shape: Sequence[int],
+    ops: Sequence[str],
+    shards: List[str],
+    shard_size: int,
+) -> None:
+    """
+    Write the label index and the metadata describing an export.
+    """
+    np.save(directory / LABELS_FILE, np.asarray(labels, dtype=np.int32))
+    index = {
+        "format": fmt,
+        "class_names": list(class_names),
+        "count": len(labels),
+        "shape": list(shape),
+        "ops": list(ops),
+        "shards": shards,
+        "shard_size": shard_size,
+    }
+    (directory / INDEX_FILE).write_text(json.dumps(index, indent=2))
+
+
+def save_tfrecords(
+    dataset: tf.data.Dataset,
+    directory: Path,
+    class_names: List[str],
+    ops: Sequence[str] = (),
+    shard_size: int = DEFAULT_SHARD_SIZE,
+) -> None:
+    """
+    Save a dataset as TFRecord shards of raw uint8 pixels.
+
+    Args:
+        dataset: Unbatched dataset of (image, label)
+        directory: Directory to save the shards in
+        class_names: List of class names
+        ops: Transformations already applied to the images
+        shard_size: Number of samples per shard
+    """
+    import tensorflow as tf
+
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / INDEX_FILE).unlink(missing_ok=True)
+    for stale in directory.glob("data-*.tfrecord"):
+        stale.unlink()
+
+    labels: List[int] = []
+    shards: List[str] = []
+    writer = None
+    shape = dataset.element_spec[0].shape
+    for image, label in tqdm(dataset.as_numpy_iterator(), desc="Saving images"):
+        if len(labels) % shard_size == 0:
+            if writer is not None:
+                writer.close()
+            shards.append(f"data-{len(shards):05d}.tfrecord")
+            writer = tf.io.TFRecordWriter(str(directory / shards[-1]))
+
+        example = tf.train.Example(
+            features=tf.train.Features(
+                feature={
+                    "image": tf.train.Feature(
+                        bytes_list=tf.train.BytesList(
+                            value=[image.astype(np.uint8).tobytes()]
+                        )
+                    ),
+                    "label": tf.train.Feature(
+                        int64_list=tf.train.Int64List(value=[int(label)])
+                    ),
+                }
+            )
+        )
+        writer.write(example.SerializeToString())
+        labels.append(int(label))
+
+    if writer is not None:
+        writer.close()
+    _write_index(
+        directory, "tfrecord", labels, class_names, shape, ops, shards, shard_size
+    )
+
+
+def save_npy(
+    dataset: tf.data.Dataset,
+    directory: Path,
+    class_names: List[str],
+    ops: Sequence[str] = (),
+    shard_size: int = DEFAULT_SHARD_SIZE,
+) -> None:
+    """
+    Save a dataset as a single memory-mappable uint8 `.npy` array.
+
+    Images are written straight into the mapped file, so the dataset is never
+    held in memory, but its cardinality must be known.
+
+    Args:
+        dataset: Unbatched dataset of (image, label)
+        directory: Directory to save the array in
+        class_names: List of class names
+        ops: Transformations already applied to the images
+        shard_size: Number of samples per block read in parallel when loading
+    """
+    count = int(dataset.cardinality())
+    if count < 0:
+        raise ValueError("The .npy format needs a dataset of known cardinality")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / INDEX_FILE).unlink(missing_ok=True)
+
+    shape = dataset.element_spec[0].shape
+    images = np.lib.format.open_memmap(
+        directory / IMAGES_FILE, mode="w+", dtype=np.uint8, shape=(count, *shape)
+    )
+    labels: List[int] = []
+    for image, label in tqdm(dataset.as_numpy_iterator(), desc="Saving images"):
+        images[len(labels)] = image
+        labels.append(int(label))
+    images.flush()
+    del images
+
+    _write_index(
+        directory, "npy", labels, class_names, shape, ops, [IMAGES_FILE], shard_size
+    )
+
+
+def export_dataset(
+    dataset: tf.data.Dataset,
+    directory: str | Path,
+    class_names: List[str],
+    fmt: str,
+    ops: Sequence[str] = (),
+) -> None:
+    """
+    Save a dataset in one of the binary formats readable by `load_export`.
+
+    Args:
+        dataset: Unbatched dataset of (image, label)
+        directory: Directory to save the dataset in
+        class_names: List of class names
+        fmt: Either "tfrecord" or "npy"
+        ops: Transformations already applied to the images
+    """
+    if fmt == "tfrecord":
+        save_tfrecords(dataset, Path(directory), class_names, ops)
+    elif fmt == "npy":
+        save_npy(dataset, Path(directory), class_names, ops)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def _parse_example(record: tf.Tensor, shape: List[int]) -> Any:
+    """
+    Decode a TFRecord sample into a (float32 image, int32 label) pair.
+    """
+    import tensorflow as tf
+
+    features = tf.io.parse_single_example(
+        record,
+        {
+            "image": tf.io.FixedLenFeature([], tf.string),
+            "label": tf.io.FixedLenFeature([], tf.int64),
+        },
+    )
+    image = tf.reshape(tf.io.decode_raw(features["image"], tf.uint8), shape)
+    return tf.cast(image, tf.float32), tf.cast(features["label"], tf.int32)
+
+
+def read_index(path: str | Path) -> Dict[str, Any]:
+    """
+    Read the metadata of an export (format, class names, count, image shape...).
+    """
+    return json.loads((Path(path) / INDEX_FILE).read_text())
+
+
+def load_export(path: str | Path) -> tf.data.Dataset:
+    """
+    Load a dataset written by `export_dataset`.
+
+    Shards (or blocks of the mapped array) are read by a parallel interleave
+    whose blocks span a whole shard, so samples come out in export order and
+    line up with the label index. Pixels are read raw, nothing is decoded.
+
+    Args:
+        path: Directory of the export
+
+    Returns:
+        tf.data.Dataset of (image, label) with known cardinality, with the
+        `class_names`, `labels`, `ops` and `file_paths` of the export
+    """
+    import tensorflow as tf
+
+    directory = Path(path)
+    index = read_index(directory)
+    shape = index["shape"]
+    shard_size = index["shard_size"]
+    files = [str(directory / shard) for shard in index["shards"]]
+
+    if index["format"] == "tfrecord":
+        dataset = tf.data.Dataset.from_tensor_slices(files).interleave(
+            tf.data.TFRecordDataset,
+            block_length=shard_size,
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=True,
+        )
+        dataset = dataset.map(
+            lambda record: _parse_example(record, shape),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+    elif index["format"] == "npy":
+        # Slices of the mapping are views: pages are read straight from the file
+        images = np.load(files[0], mmap_mode="r")
+        labels_array = np.load(directory / LABELS_FILE)
+
+        def read_block(start: np.int64) -> Any:
+            return (
+                images[start : start + shard_size],
+                labels_array[start : start + shard_size],
+            )
+
+        def block_dataset(start: tf.Tensor) -> tf.data.Dataset:
+            block_images, block_labels = tf.numpy_function(
+                read_block, [start], (tf.uint8, tf.int32)
+            )
+            block_images.set_shape([None, *shape])
+            block_labels.set_shape([None])
+            return tf.data.Dataset.from_tensor_slices((block_images, block_labels))
+
+        dataset = tf.data.Dataset.range(0, index["count"], shard_size).interleave(
+            block_dataset,
+            block_length=shard_size,
+            num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=True,
+        )
+        dataset = dataset.map(
+            lambda image, label: (tf.cast(image, tf.float32), label),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+    else:
+        raise ValueError(f"Unknown export format: {index['format']}")
+
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(index["count"]))
+    dataset.class_names = index["class_names"]
+    dataset.labels = np.load(directory / LABELS_FILE)
+    dataset.ops = index["ops"]
+    dataset.file_paths = files
+    return dataset
@@ -1,5 +1,109 @@
-IMG_HEIGHT = 256
-IMG_WIDTH = 256
-BATCH_SIZE = 32
-CLASSES = 8
-EPOCHS = 20
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+import attrs
+
+# Environment variables override the configuration file, e.g. LEAFFLICTION_EPOCHS
+ENV_PREFIX = "LEAFFLICTION_"
+
+
+@attrs.define(frozen=True, slots=True)
+class Hyperparams:
+    """
+    Settings shared by the preprocessing, training and prediction scripts.
+    """
+
+    img_height: int = attrs.field(default=256, validator=attrs.validators.gt(0))
+    img_width: int = attrs.field(default=256, validator=attrs.validators.gt(0))
+    batch_size: int = attrs.field(default=32, validator=attrs.validators.gt(0))
+    epochs: int = attrs.field(default=20, validator=attrs.validators.gt(0))
+
+    @property
+    def image_size(self) -> Tuple[int, int]:
+        """
+        (height, width) of the images fed to the model.
+        """
+        return (self.img_height, self.img_width)
+
+
+DEFAULTS = Hyperparams()
+
+FIELDS = tuple(field.name for field in attrs.fields(Hyperparams))
+
+HELP = {
+    "img_height": "Height images are resized to",
+    "img_width": "Width images are resized to",
+    "batch_size": "Number of images per batch",
+    "epochs": "Number of training epochs",
+}
+
+
+def load_hyperparams(
+    path: Optional[str | Path] = None,
+    environ: Mapping[str, str] = os.environ,
+    **overrides: Optional[int],
+) -> Hyperparams:
+    """
+    Resolve the hyperparameters from their sources, by increasing precedence:
+    defaults, JSON configuration file, environment, then `overrides`.
+
+    Args:
+        path: JSON file mapping field names to values
+        environ: Environment, read for `ENV_PREFIX` + upper-case field names
+        **overrides: Values given on the command line, None when not given
+
+    Returns:
+        The resolved hyperparameters
+    """
+    values: Dict[str, Any] = {}
+    if path is not None:
+        values.update(json.loads(Path(path).read_text()))
+    for name in FIELDS:
+        value = environ.get(f"{ENV_PREFIX}{name.upper()}")
+        if value is not None:
+            values[name] = int(value)
+    values.update(
+        {name: value for name, value in overrides.items() if value is not None}
+    )
+
+    unknown = sorted(set(values) - set(FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters: {', '.join(unknown)}")
+    return Hyperparams(**values)
+
+
+def add_hyperparams_arguments(
+    parser: argparse.ArgumentParser, fields: Sequence[str] = FIELDS
+) -> None:
+    """
+    Add `--config` and one option per hyperparameter in `fields` to a parser.
+
+    Args:
+        parser: Parser of an entry point
+        fields: Hyperparameters used by the entry point
+    """
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=None,
+        help=f"JSON file of hyperparameters ({', '.join(FIELDS)}), overridden by "
+        f"{ENV_PREFIX}<NAME> environment variables and by the options below",
+    )
+    for name in fields:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=int,
+            default=None,
+            help=f"{HELP[name]} (default: {getattr(DEFAULTS, name)})",
+        )
+
+
+def hyperparams_from_args(args: argparse.Namespace) -> Hyperparams:
+    """
+    Resolve the hyperparameters of an entry point from its parsed arguments.
+    """
+    return load_hyperparams(
+        args.config, **{name: getattr(args, name, None) for name in FIELDS}
+    )
@@ -0,0 +1,47 @@
+import numpy as np
+from pathlib import Path
+from PIL import Image
+from typing import List, Tuple
+from .hyperparams import DEFAULTS
+
+
+def load_image(path: str, size: Tuple[int, int] = DEFAULTS.image_size) -> np.ndarray:
+    """
+    Load an RGB image without TensorFlow.
+
+    Gives the same pixels as `tf.keras.utils.load_img(path, target_size=size)`
+    followed by `img_to_array(...).astype(np.uint8)`.
+
+    Args:
+        path: Path of the image
+        size: Target (height, width)
+
+    Returns:
+        uint8 array of shape (height, width, 3)
+    """
+    with Image.open(path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != (size[1], size[0]):
+            img = img.resize((size[1], size[0]), Image.NEAREST)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def list_class_names(directory: str) -> List[str]:
+    """
+    Class names of a dataset directory, one subdirectory per class.
+
+    Hidden directories (`.ipynb_checkpoints`, ...) are skipped, as
+    `image_dataset_from_directory` does.
+
+    Args:
+        directory: Dataset directory
+
+    Returns:
+        Sorted class names, in label order
+    """
+    return sorted(
+        entry.name
+        for entry in Path(directory).iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    )
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from tqdm import tqdm
+from typing import Any, Dict, List, NamedTuple, Tuple
+from .hyperparams import DEFAULTS
+from .images import list_class_names
+from .transforms import (
+    create_parallel_transformed_generator,
+    create_transformed_generator,
+)
+
+
+MANIFEST_FILE = ".transformation-manifest.json"
+
+# Same formats as `image_dataset_from_directory`
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif"}
+
+
+class Update(NamedTuple):
+    """
+    Work needed to bring a destination directory up to date.
+    """
+
+    # Manifest entries of the sources that are still up to date
+    unchanged: Dict[str, Dict[str, Any]]
+    # Manifest entries (to be produced) of the added or modified sources
+    changed: Dict[str, Dict[str, Any]]
+    # Outputs whose sources were removed
+    removed: List[str]
+
+
+def _file_hash(path: Path) -> str:
+    """
+    Hash the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _output_name(source: str) -> str:
+    """
+    Name of the JPEG output of a source image, relative to the destination.
+    """
+    path = Path(source)
+    if path.suffix.lower() in (".jpg", ".jpeg"):
+        return source
+    return f"{source}.JPG"
+
+
+def list_sources(src: Path) -> List[str]:
+    """
+    List the images of a dataset directory, one subdirectory per class.
+
+    Hidden class directories are skipped, as `train.py` does not load them.
+
+    Args:
+        src: Dataset directory
+
+    Returns:
+        Sorted paths of the images, relative to `src`
+    """
+    return sorted(
+        path.relative_to(src).as_posix()
+        for class_name in list_class_names(str(src))
+        for path in (src / class_name).rglob("*")
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def load_manifest(
+    dst: Path, ops: List[str], image_size: Tuple[int, int]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the entries of the manifest of `dst`, if it was made with `ops`.
+
+    Args:
+        dst: Destination directory
+        ops: List of transformation operations to apply
+        image_size: (height, width) the images are loaded at
+
+    Returns:
+        Dictionary mapping each source path to its manifest entry
+    """
+    path = dst / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    manifest = json.loads(path.read_text())
+    if manifest["ops"] != ops or manifest["size"] != list(image_size):
+        # Every output is stale, but their names are kept
+        return {
+            source: {**entry, "sha256": None}
+            for source, entry in manifest["files"].items()
+        }
+    return manifest["files"]
+
+
+def save_manifest(
+    dst: Path,
+    ops: List[str],
+    files: Dict[str, Dict[str, Any]],
+    image_size: Tuple[int, int],
+) -> None:
+    """
+    Write the manifest of `dst`.
+
+    Args:
+        dst: Destination directory
+        ops: Transformation operations the outputs were made with
+        files: Dictionary mapping each source path to its manifest entry
+        image_size: (height, width) the images were loaded at
+    """
+    manifest = {
+        "ops": ops,
+        "size": list(image_size),
+        "files": dict(sorted(files.items())),
+    }
+    path = dst / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest))
+    tmp.replace(path)
+
+
+def plan_update(
+    src: Path, dst: Path, sources: List[str], manifest: Dict[str, Any]
+) -> Update:
+    """
+    Compare the source images to the manifest.
+
+    Files whose size and modification time did not change are not hashed again.
+
+    Args:
+        src: Dataset directory
+        dst: Destination directory
+        sources: Paths of the images, relative to `src`
+        manifest: Entries of the manifest of the destination
+
+    Returns:
+        Update splitting the sources into unchanged and changed entries
+    """
+    unchanged: Dict[str, Dict[str, Any]] = {}
+    changed: Dict[str, Dict[str, Any]] = {}
+    for source in sources:
+        stat = (src / source).stat()
+        entry = manifest.get(source)
+        if entry is None or not (dst / entry["output"]).exists():
+            entry = {"sha256": None}
+        elif entry["sha256"] is not None and (entry["mtime_ns"], entry["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            unchanged[source] = entry
+            continue
+
+        sha256 = _file_hash(src / source)
+        new_entry = {
+            "sha256": sha256,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "output": _output_name(source),
+        }
+        if entry["sha256"] == sha256:
+            unchanged[source] = new_entry
+        else:
+            changed[source] = new_entry
+
+    listed = set(sources)
+    removed = [
+        entry["output"] for source, entry in manifest.items() if source not in listed
+    ]
+    return Update(unchanged, changed, removed)
+
+
+def _load_image(path: tf.Tensor, image_size: Tuple[int, int]) -> tf.Tensor:
+    """
+    Load an image like `image_dataset_from_directory` does.
+    """
+    image = tf.io.decode_image(
+        tf.io.read_file(path), channels=3, expand_animations=False
+    )
+    return tf.image.resize(image, image_size)
+
+
+def transform_directory(
+    src: Path,
+    dst: Path,
+    ops: List[str],
+    workers: int = 1,
+    chunk_size: int = 64,
+    image_size: Tuple[int, int] = DEFAULTS.image_size,
+) -> Update:
+    """
+    Incrementally transform a dataset directory into `dst`.
+
+    Outputs keep the relative path of their source, so they are never
+    renumbered. Only the images added or modified since the last run are
+    transformed, and the outputs of removed images are deleted. The manifest
+    is written even if the run is interrupted, so finished images are kept.
+
+    Args:
+        src: Dataset directory
+        dst: Destination directory
+        ops: List of transformation operations to apply
+        workers: Number of processes to transform with (1 runs in-process)
+        chunk_size: Number of images transformed together
+        image_size: (height, width) the images are loaded at
+
+    Returns:
+        Update that was applied
+    """
+    dst.mkdir(parents=True, exist_ok=True)
+    sources = list_sources(src)
+    update = plan_update(src, dst, sources, load_manifest(dst, ops, image_size))
+    print(
+        f"✅ {len(update.unchanged)} up to date, {len(update.changed)} to transform, "
+        f"{len(update.removed)} removed."
+    )
+
+    for output in update.removed:
+        (dst / output).unlink(missing_ok=True)
+
+    files = dict(update.unchanged)
+    changed = list(update.changed)
+    try:
+        if changed:
+            # Positions stand in for labels to match outputs to their sources
+            dataset = tf.data.Dataset.from_tensor_slices(
+                ([str(src / source) for source in changed], np.arange(len(changed)))
+            ).map(
+                lambda path, position: (_load_image(path, image_size), position),
+                num_parallel_calls=tf.data.AUTOTUNE,
+            )
+            if workers > 1:
+                generator = create_parallel_transformed_generator(
+                    dataset, ops, workers, chunk_size
+                )
+            else:
+                generator = create_transformed_generator(dataset, ops, chunk_size)
+
+            for image, position in tqdm(
+                generator, total=len(changed), desc="Saving images"
+            ):
+                source = changed[position]
+                output = dst / update.changed[source]["output"]
+                output.parent.mkdir(parents=True, exist_ok=True)
+                image = tf.keras.utils.array_to_img(image.astype(np.uint8))
+                image.save(output, format="JPEG")
+                files[source] = update.changed[source]
+    finally:
+        save_manifest(dst, ops, files, image_size)
+
+    return update
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+import warnings
+import numpy as np
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+# How a saved model is run: Keras, a TFLite interpreter, or plain NumPy
+BACKENDS = ("keras", "tflite", "numpy")
+
+# TFLite flatbuffers exported next to the Keras model
+LITE_VARIANTS = ("float32", "float16", "int8")
+
+# Samples used to calibrate the int8 quantization
+CALIBRATION_SAMPLES = 100
+
+Layer = Callable[[np.ndarray], np.ndarray]
+
+
+def convert_to_tflite(
+    model: tf.keras.Model,
+    variant: str,
+    calibration: Optional[tf.data.Dataset] = None,
+) -> bytes:
+    """
+    Convert a Keras model to a TFLite flatbuffer.
+
+    Inputs and outputs stay float32 in every variant, so the flatbuffers take
+    the same images as the Keras model.
+
+    Args:
+        model: Trained Keras model
+        variant: One of `LITE_VARIANTS`: no quantization, float16 weights, or
+            weights and activations quantized to int8
+        calibration: Unbatched dataset of (image, label), required for int8
+
+    Returns:
+        The serialized flatbuffer
+    """
+    import tensorflow as tf
+
+    if variant not in LITE_VARIANTS:
+        raise ValueError(f"Unknown TFLite variant: {variant}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if calibration is None:
+            raise ValueError("The int8 variant needs a calibration dataset")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.representative_dataset = lambda: (
+            [tf.cast(image, tf.float32)[tf.newaxis]]
+            for image, _ in calibration.take(CALIBRATION_SAMPLES)
+        )
+    # Keras prints a summary of the intermediate SavedModel
+    with contextlib.redirect_stdout(io.StringIO()):
+        return converter.convert()
+
+
+def _interpreter_class() -> Any:
+    """
+    Find a TFLite interpreter, preferring the standalone runtimes to TensorFlow.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter  # type: ignore
+
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter  # type: ignore
+
+        return Interpreter
+    except ImportError:
+        pass
+
+    import tensorflow as tf
+
+    return tf.lite.Interpreter
+
+
+class LiteModel:
+    """
+    Run a TFLite flatbuffer behind the prediction interface of a Keras model.
+    """
+
+    def __init__(self, content: bytes, class_names: List[str]) -> None:
+        """
+        Args:
+            content: Serialized flatbuffer
+            class_names: Class name of every output
+        """
+        interpreter_class = _interpreter_class()
+        with warnings.catch_warnings():
+            # tf.lite.Interpreter warns about its deprecation on every call
+            warnings.simplefilter("ignore")
+            self._interpreter = interpreter_class(
+                model_content=content, num_threads=os.cpu_count() or 1
+            )
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = 0
+        self.class_names = class_names
+        self.image_size = tuple(int(side) for side in self._input["shape"][1:3])
+
+    def predict_on_batch(self, images: np.ndarray) -> np.ndarray:
+        """
+        Predict the class probabilities of a batch of images.
+
+        Args:
+            images: (N, H, W, 3) images
+
+        Returns:
+            (N, classes) float32 probabilities
+        """
+        if len(images) != self._batch_size:
+            self._interpreter.resize_tensor_input(
+                self._input["index"], [len(images), *self._input["shape"][1:]]
+            )
+            self._interpreter.allocate_tensors()
+            self._batch_size = len(images)
+
+        self._interpreter.set_tensor(
+            self._input["index"], np.asarray(images, dtype=self._input["dtype"])
+        )
+        self._interpreter.invoke()
+        # Copied, as the interpreter reuses its output buffer
+        return self._interpreter.get_tensor(self._output["index"]).copy()
+
+    def predict(self, images: np.ndarray, **kwargs: Any) -> np.ndarray:
+        """
+        Same as `predict_on_batch`, for callers of `tf.keras.Model.predict`.
+        """
+        return self.predict_on_batch(images)
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+_ACTIVATIONS: Dict[str, Layer] = {
+    "linear": lambda x: x,
+    # Layers apply their activation to a fresh array, which can be reused
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "softmax": _softmax,
+}
+
+
+def _separable_conv2d(
+    x: np.ndarray,
+    depthwise: np.ndarray,
+    pointwise: np.ndarray,
+    bias: Optional[np.ndarray],
+    padding: str,
+    activation: Layer,
+) -> np.ndarray:
+    """
+    Depthwise convolution as a sum of shifted products, then a 1x1 convolution.
+    """
+    kh, kw = depthwise.shape[:2]
+    if padding == "same":
+        x = np.pad(
+            x, ((0, 0), ((kh - 1) // 2, kh // 2), ((kw - 1) // 2, kw // 2), (0, 0))
+        )
+    height, width = x.shape[1] - kh + 1, x.shape[2] - kw + 1
+
+    out = np.zeros((x.shape[0], height, width, x.shape[3]), dtype=np.float32)
+    for i in range(kh):
+        for j in range(kw):
+            out += x[:, i : i + height, j : j + width] * depthwise[i, j, :, 0]
+    out = out @ pointwise[0, 0]
+    if bias is not None:
+        out += bias
+    return activation(out)
+
+
+def _max_pooling2d(x: np.ndarray, pool: int) -> np.ndarray:
+    """
+    Max pooling with non-overlapping windows and "valid" padding.
+    """
+    n, height, width, channels = x.shape
+    height, width = height // pool, width // pool
+    x = x[:, : height * pool, : width * pool]
+    return x.reshape(n, height, pool, width, pool, channels).max(axis=(2, 4))
+
+
+def _dense(
+    x: np.ndarray, kernel: np.ndarray, bias: Optional[np.ndarray], activation: Layer
+) -> np.ndarray:
+    out = x @ kernel
+    if bias is not None:
+        out += bias
+    return activation(out)
+
+
+def _build_separable_conv2d(config: Dict[str, Any], weights: Iterator) -> Layer:
+    if (
+        config["depth_multiplier"] != 1
+        or tuple(config["strides"]) != (1, 1)
+        or tuple(config["dilation_rate"]) != (1, 1)
+    ):
+        raise ValueError("Only unit strides, dilations and depth multipliers run")
+    return partial(
+        _separable_conv2d,
+        depthwise=next(weights),
+        pointwise=next(weights),
+        bias=next(weights) if config["use_bias"] else None,
+        padding=config["padding"],
+        activation=_ACTIVATIONS[config["activation"]],
+    )
+
+
+def _build_max_pooling2d(config: Dict[str, Any], weights: Iterator) -> Layer:
+    pool = config["pool_size"][0]
+    if tuple(config["pool_size"]) != (pool, pool) or tuple(
+        config["strides"] or config["pool_size"]
+    ) != (pool, pool):
+        raise ValueError("Only square, non-overlapping pooling windows run")
+    return partial(_max_pooling2d, pool=pool)
+
+
+def _build_dense(config: Dict[str, Any], weights: Iterator) -> Layer:
+    return partial(
+        _dense,
+        kernel=next(weights),
+        bias=next(weights) if config["use_bias"] else None,
+        activation=_ACTIVATIONS[config["activation"]],
+    )
+
+
+_LAYER_BUILDERS: Dict[str, Callable[[Dict[str, Any], Iterator], Optional[Layer]]] = {
+    "InputLayer": lambda config, weights: None,
+    # Inference only: dropout is the identity
+    "Dropout": lambda config, weights: None,
+    "Flatten": lambda config, weights: lambda x: x.reshape(len(x), -1),
+    "SeparableConv2D": _build_separable_conv2d,
+    "MaxPooling2D": _build_max_pooling2d,
+    "Dense": _build_dense,
+}
+
+
+class NumpyModel:
+    """
+    Run a Sequential model from its architecture and weights with NumPy only.
+
+    Covers the layers of `build_model`, so a saved model can predict where
+    neither TensorFlow nor a TFLite runtime is available.
+    """
+
+    def __init__(
+        self,
+        architecture: Dict[str, Any],
+        weights: List[np.ndarray],
+        class_names: List[str],
+    ) -> None:
+        """
+        Args:
+            architecture: Keras JSON configuration of a Sequential model
+            weights: Weights of the model, in `get_weights` order
+            class_names: Class name of every output
+        """
+        self._layers: List[Layer] = []
+        layers = architecture["config"]["layers"]
+        self.image_size = tuple(layers[0]["config"]["batch_shape"][1:3])
+        remaining = iter(weights)
+        for layer in layers:
+            if layer["class_name"] not in _LAYER_BUILDERS:
+                raise ValueError(f"Layer not supported: {layer['class_name']}")
+            built = _LAYER_BUILDERS[layer["class_name"]](layer["config"], remaining)
+            if built is not None:
+                self._layers.append(built)
+        self.class_names = class_names
+
+    def predict_on_batch(self, images: np.ndarray) -> np.ndarray:
+        """
+        Predict the class probabilities of a batch of images.
+
+        Args:
+            images: (N, H, W, 3) images
+
+        Returns:
+            (N, classes) float32 probabilities
+        """
+        x = np.asarray(images, dtype=np.float32)
+        for layer in self._layers:
+            x = layer(x)
+        return x
+
+    def predict(self, images: np.ndarray, **kwargs: Any) -> np.ndarray:
+        """
+        Same as `predict_on_batch`, for callers of `tf.keras.Model.predict`.
+        """
+        return self.predict_on_batch(images)
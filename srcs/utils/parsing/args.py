@@ -1,6 +1,10 @@
 import argparse
+import os
 from pathlib import Path
 from transforms.registry import available_ops
+from utils.export import EXPORT_FORMATS
+from utils.hyperparams import add_hyperparams_arguments
+from utils.profiling import add_profile_argument
 
 
 def validate_src_path(s: str, should_exist: bool = True) -> Path:
@@ -42,6 +46,8 @@ def config_single_parser(parser: argparse.ArgumentParser) -> None:
         default="all",
         help="Choice to display all ops or just the last one",
     )
+    add_hyperparams_arguments(parser, ("img_height", "img_width"))
+    add_profile_argument(parser)
 
 
 def config_multi_parser(parser: argparse.ArgumentParser) -> None:
@@ -74,6 +80,27 @@ def config_multi_parser(parser: argparse.ArgumentParser) -> None:
         ],
         help=f"Comma-separated list of ops. Available: {', '.join(available_ops())}",
     )
+    _ = parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes used to transform images (1 disables the pool)",
+    )
+    _ = parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="jpg",
+        help="Save results as JPEG files, TFRecord shards or a memory-mapped .npy "
+        "array (the last two can be read by train.py)",
+    )
+    _ = parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only transform images added or modified since the last run (tracked "
+        "by a manifest in dst) and delete the outputs of removed images",
+    )
+    add_hyperparams_arguments(parser, ("img_height", "img_width"))
+    add_profile_argument(parser)
 
 
 def parse_args() -> argparse.Namespace:
@@ -1,70 +1,177 @@
-from typing import List
-import tensorflow as tf
+from __future__ import annotations
+
+from typing import Any, Deque, Dict, List, Optional, Tuple, TYPE_CHECKING
 import zipfile
 import io
+import mmap
+import struct
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 import json
 import os
+from ..inference import BACKENDS, LiteModel, NumpyModel
 
+if TYPE_CHECKING:
+    import tensorflow as tf
 
 ZIP_PATH = "models/model.zip"
 
+# How datasets are packaged: encoded in the archive, described by a manifest,
+# or left out
+DATASET_MODES = ("embed", "manifest", "skip")
+
+# Alignment of the weights in the archive, so they can be mapped as arrays
+WEIGHTS_ALIGNMENT = 64
+
+# Extra field used by zipalign to pad local headers
+_ALIGNMENT_EXTRA_ID = 0xD935
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = 0x04034B50
+
+# Models already loaded by this process, by (path, mtime, size) of their archive
+# and by backend
+_MODELS: Dict[Tuple[str, int, int, str, str], Any] = {}
+
+
+def _encode_jpegs(images: np.ndarray) -> List[bytes]:
+    """
+    Encode a batch of images to JPEG.
+
+    Args:
+        images: Batch of images
+
+    Returns:
+        Encoded images, in batch order
+    """
+    encoded = []
+    for image in images.astype(np.uint8):
+        img_buffer = io.BytesIO()
+        # PIL releases the GIL while encoding, so threads run in parallel
+        Image.fromarray(image).save(img_buffer, format="JPEG")
+        encoded.append(img_buffer.getvalue())
+    return encoded
+
 
 def _save_dataset_to_zip(
-    zipf: zipfile.ZipFile, dataset: tf.data.Dataset, name: str, class_names: List[str]
+    zipf: zipfile.ZipFile,
+    dataset: tf.data.Dataset,
+    name: str,
+    class_names: List[str],
+    workers: int = 1,
+    chunk_size: int = 64,
 ) -> None:
     """
     Save a TensorFlow dataset to a zip file in image format without temp files.
 
+    Chunks of images are encoded by a pool of threads while the archive is
+    written in order, with at most two chunks per thread in flight.
+
     Args:
         zipf: ZipFile object to write the dataset files to
         dataset: TensorFlow dataset
+        name: Name of the dataset directory in the archive
+        class_names: List of class names
+        workers: Number of threads encoding images
+        chunk_size: Number of images encoded per task
     """
-    dataset = dataset.unbatch()
+    dataset = dataset.unbatch().batch(chunk_size)
     class_counters = {class_name: 0 for class_name in class_names}
 
-    for image, label in dataset.as_numpy_iterator():
-        image = image.astype(np.uint8)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: Deque[Tuple[List[str], Future]] = deque()
 
-        class_name = class_names[label]
-        filename = f"{class_name}_{class_counters[class_name]:05d}.jpg"
+        def drain(max_pending: int) -> None:
+            while len(pending) > max_pending:
+                filenames, future = pending.popleft()
+                for filename, data in zip(filenames, future.result()):
+                    zipf.writestr(filename, data)
 
-        img_buffer = io.BytesIO()
-        Image.fromarray(image).save(img_buffer, format="JPEG")
+        for images, labels in dataset.as_numpy_iterator():
+            filenames = []
+            for label in labels:
+                class_name = class_names[label]
+                filenames.append(
+                    f"data/{name}/{class_name}/"
+                    f"{class_name}_{class_counters[class_name]:05d}.jpg"
+                )
+                class_counters[class_name] += 1
 
-        zipf.writestr(f"data/{name}/{class_name}/{filename}", img_buffer.getvalue())
-        class_counters[class_name] += 1
+            pending.append((filenames, pool.submit(_encode_jpegs, images)))
+            drain(2 * workers)
+        drain(0)
 
 
-def _save_model_to_zip(zipf: zipfile.ZipFile, model: tf.keras.Model) -> None:
+def _writestr_aligned(zipf: zipfile.ZipFile, name: str, data: bytes) -> None:
     """
-    Save a TensorFlow model to a zip file without temp files using h5py.
+    Store an entry whose data starts at a multiple of `WEIGHTS_ALIGNMENT`.
+
+    The local header is padded with a zipalign extra field, which readers skip.
+
+    Args:
+        zipf: ZipFile object to write the entry to
+        name: Name of the entry
+        data: Content of the entry
+    """
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    extra_header = struct.calcsize("<HHH")
+    data_offset = (
+        zipf.start_dir + _LOCAL_HEADER.size + len(name.encode()) + extra_header
+    )
+    padding = -data_offset % WEIGHTS_ALIGNMENT
+    info.extra = struct.pack(
+        "<HHH", _ALIGNMENT_EXTRA_ID, 2 + padding, WEIGHTS_ALIGNMENT
+    ) + bytes(padding)
+    zipf.writestr(info, data)
+
+
+def _save_model_to_zip(
+    zipf: zipfile.ZipFile,
+    model: tf.keras.Model,
+    lite_models: Optional[Dict[str, bytes]] = None,
+) -> None:
+    """
+    Save a TensorFlow model to a zip file without temp files.
+
+    Weights are stored raw in a single aligned entry described by
+    model/weights.json, so that loading maps them instead of reading them.
 
     Args:
         zipf: ZipFile object to write the model files to
         model: TensorFlow model
+        lite_models: TFLite flatbuffers of the model, by variant
     """
     model_json = model.to_json()
     zipf.writestr("model/architecture.json", model_json)
 
-    weights_buffer = io.BytesIO()
-    weights = model.get_weights()
-
-    weights_dict = {}
-    for i, weight_array in enumerate(weights):
-        weights_dict[f"weight_{i}"] = weight_array
+    class_names = json.dumps(model.class_names)
+    zipf.writestr("model/classes.json", class_names)
 
-    # np requires named arrays
-    np.savez_compressed(weights_buffer, **weights_dict)
-    zipf.writestr("model/weights.npz", weights_buffer.getvalue())
+    layout = []
+    weights_buffer = io.BytesIO()
+    for weight_array in model.get_weights():
+        weight_array = np.ascontiguousarray(weight_array)
+        weights_buffer.write(bytes(-weights_buffer.tell() % WEIGHTS_ALIGNMENT))
+        layout.append(
+            {
+                "dtype": weight_array.dtype.str,
+                "shape": list(weight_array.shape),
+                "offset": weights_buffer.tell(),
+            }
+        )
+        weights_buffer.write(weight_array.tobytes())
+    zipf.writestr("model/weights.json", json.dumps(layout))
+    _writestr_aligned(zipf, "model/weights.bin", weights_buffer.getvalue())
 
     summary_buffer = io.StringIO()
     model.summary(print_fn=lambda x: summary_buffer.write(x + "\n"))
     zipf.writestr("model/summary.txt", summary_buffer.getvalue())
 
-    class_names = json.dumps(model.class_names)
-    zipf.writestr("model/classes.json", class_names)
+    for variant, content in (lite_models or {}).items():
+        _writestr_aligned(zipf, f"model/model_{variant}.tflite", content)
 
 
 def save_to_zip(
@@ -72,32 +179,281 @@ def save_to_zip(
     train_dataset: tf.data.Dataset,
     validation_dataset: tf.data.Dataset,
     test_dataset: tf.data.Dataset,
+    datasets: str = "embed",
+    manifest: Optional[Dict[str, Any]] = None,
+    workers: int = 1,
+    lite_models: Optional[Dict[str, bytes]] = None,
 ) -> None:
     """
     Save a TensorFlow model and multiple datasets to a zip file.
 
+    Entries are stored without compression: JPEGs and weights do not shrink
+    any further, and the archive opens faster.
+
     Args:
         model: The TensorFlow model to save.
         train_dataset: The training dataset to save.
         validation_dataset: The validation dataset to save.
         test_dataset: The test dataset to save.
+        datasets: One of `DATASET_MODES`: embed the images, write `manifest`
+            to data/manifest.json instead, or only save the model.
+        manifest: Description of the datasets, required with "manifest".
+        workers: Number of threads encoding images.
+        lite_models: TFLite flatbuffers of the model, by variant.
     """
+    if datasets not in DATASET_MODES:
+        raise ValueError(f"Unknown dataset mode: {datasets}")
+    if datasets == "manifest" and manifest is None:
+        raise ValueError("A manifest is required to reference the datasets")
+
     os.makedirs(os.path.dirname(ZIP_PATH), exist_ok=True)
 
-    with zipfile.ZipFile(ZIP_PATH, "w") as zipf:
-        _save_model_to_zip(zipf, model)
+    with zipfile.ZipFile(ZIP_PATH, "w", compression=zipfile.ZIP_STORED) as zipf:
+        _save_model_to_zip(zipf, model, lite_models)
+
+        if datasets == "manifest":
+            zipf.writestr("data/manifest.json", json.dumps(manifest))
+        elif datasets == "embed":
+            for dataset, name in (
+                (train_dataset, "train"),
+                (validation_dataset, "validation"),
+                (test_dataset, "test"),
+            ):
+                _save_dataset_to_zip(
+                    zipf, dataset, name, model.class_names, workers=workers
+                )
+
+
+def _model_entries(archive: mmap.mmap) -> Dict[str, Tuple[int, int]]:
+    """
+    Locate the model entries, written first, from their local headers.
+
+    Unlike `zipfile.ZipFile`, this stops at the first dataset entry instead of
+    parsing the central directory of the whole archive.
+
+    Args:
+        archive: Mapped zip file
+
+    Returns:
+        Dictionary mapping the name of each stored model entry to the
+        (offset, size) of its data
+    """
+    entries: Dict[str, Tuple[int, int]] = {}
+    offset = 0
+    while offset + _LOCAL_HEADER.size <= len(archive):
+        (
+            signature,
+            _,
+            flags,
+            compression,
+            _,
+            _,
+            _,
+            compressed_size,
+            _,
+            name_length,
+            extra_length,
+        ) = _LOCAL_HEADER.unpack_from(archive, offset)
+        # Sizes deferred to a data descriptor cannot be skipped over
+        if signature != _LOCAL_HEADER_SIGNATURE or flags & 0x08:
+            break
+        name_offset = offset + _LOCAL_HEADER.size
+        name = archive[name_offset : name_offset + name_length].decode()
+        if not name.startswith("model/"):
+            break
+        data_offset = name_offset + name_length + extra_length
+        if compression == zipfile.ZIP_STORED:
+            entries[name] = (data_offset, compressed_size)
+        offset = data_offset + compressed_size
+    return entries
+
+
+def _open_model_entries(path: str) -> Tuple[mmap.mmap, Dict[str, Tuple[int, int]]]:
+    """
+    Map an archive and locate its model entries.
+
+    Args:
+        path: Path of the zip file
 
-        _save_dataset_to_zip(zipf, train_dataset, "train", model.class_names)
-        _save_dataset_to_zip(zipf, validation_dataset, "validation", model.class_names)
-        _save_dataset_to_zip(zipf, test_dataset, "test", model.class_names)
+    Returns:
+        The mapped archive and the entries found by `_model_entries`
+    """
+    with open(path, "rb") as f:
+        archive = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return archive, _model_entries(archive)
 
 
-def load_model_from_zip() -> tf.keras.Model:
+def _read_entry(
+    archive: mmap.mmap, entries: Dict[str, Tuple[int, int]], name: str
+) -> bytes:
+    """
+    Read a stored model entry of a mapped archive.
+    """
+    offset, size = entries[f"model/{name}"]
+    return archive[offset : offset + size]
+
+
+def _mapped_weights(
+    archive: mmap.mmap, entries: Dict[str, Tuple[int, int]]
+) -> List[np.ndarray]:
+    """
+    View the weights of a mapped archive as read-only arrays over the mapping.
+
+    Only the NumPy backend runs on these views as they are; Keras copies them
+    into its variables. The mapping cannot be closed while the views are alive.
+    """
+    weights_offset, _ = entries["model/weights.bin"]
+    return [
+        np.frombuffer(
+            archive,
+            dtype=np.dtype(array["dtype"]),
+            count=int(np.prod(array["shape"])),
+            offset=weights_offset + array["offset"],
+        ).reshape(array["shape"])
+        for array in json.loads(_read_entry(archive, entries, "weights.json"))
+    ]
+
+
+def _load_mapped_model(path: str) -> Optional[tf.keras.Model]:
+    """
+    Build a model from an archive with mappable weights.
+
+    The weights are read from the mapped archive without an intermediate
+    buffer, then copied once into the variables of the model.
+
+    Args:
+        path: Path of the zip file
+
+    Returns:
+        The model, or None if the archive predates model/weights.bin
+    """
+    import tensorflow as tf
+
+    archive, entries = _open_model_entries(path)
+    needed = ("architecture.json", "classes.json", "weights.json", "weights.bin")
+    if any(f"model/{name}" not in entries for name in needed):
+        archive.close()
+        return None
+
+    model = tf.keras.models.model_from_json(
+        _read_entry(archive, entries, "architecture.json").decode("utf-8")
+    )
+    model.class_names = json.loads(_read_entry(archive, entries, "classes.json"))
+    weights = _mapped_weights(archive, entries)
+    model.set_weights(weights)
+
+    # The views must be gone before the mapping can be closed
+    del weights
+    archive.close()
+    return model
+
+
+def _load_lite_model(path: str, variant: str) -> LiteModel:
+    """
+    Load a TFLite flatbuffer exported with the model.
+
+    Args:
+        path: Path of the zip file
+        variant: One of `LITE_VARIANTS`
+
+    Returns:
+        The flatbuffer, behind the prediction interface of a Keras model
+    """
+    archive, entries = _open_model_entries(path)
+    try:
+        if f"model/model_{variant}.tflite" not in entries:
+            raise ValueError(
+                f"{path} has no {variant} TFLite model, train again with "
+                f"--tflite {variant}"
+            )
+        return LiteModel(
+            _read_entry(archive, entries, f"model_{variant}.tflite"),
+            json.loads(_read_entry(archive, entries, "classes.json")),
+        )
+    finally:
+        archive.close()
+
+
+def _load_numpy_model(path: str) -> NumpyModel:
+    """
+    Load a model that runs with NumPy only, on the mapped weights.
+
+    Args:
+        path: Path of the zip file
+
+    Returns:
+        The model, behind the prediction interface of a Keras model
+    """
+    archive, entries = _open_model_entries(path)
+    if "model/weights.bin" not in entries:
+        archive.close()
+        raise ValueError(f"{path} predates mappable weights, train again")
+
+    # The mapping stays open as long as the model references the weights
+    return NumpyModel(
+        json.loads(_read_entry(archive, entries, "architecture.json")),
+        _mapped_weights(archive, entries),
+        json.loads(_read_entry(archive, entries, "classes.json")),
+    )
+
+
+def load_model_from_zip(
+    path: Optional[str] = None, backend: str = "keras", variant: str = "float16"
+) -> Any:
     """
     Load a TensorFlow model from a zip file.
+
+    Models are cached per process: loading the same, unmodified archive again
+    returns the model built the first time.
+
+    Args:
+        path: Path of the zip file, defaults to `ZIP_PATH`
+        backend: One of `BACKENDS`: a Keras model, a TFLite interpreter, or
+            a NumPy implementation of the layers
+        variant: TFLite flatbuffer to load, one of `LITE_VARIANTS`
+
+    Returns:
+        The model, with `predict`, `predict_on_batch`, `class_names` and the
+        `image_size` it takes
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    path = os.path.realpath(path or ZIP_PATH)
+    stat = os.stat(path)
+    key = (
+        path,
+        stat.st_mtime_ns,
+        stat.st_size,
+        backend,
+        variant if backend == "tflite" else "",
+    )
+    if key in _MODELS:
+        return _MODELS[key]
+
+    if backend == "tflite":
+        model = _load_lite_model(path, variant)
+    elif backend == "numpy":
+        model = _load_numpy_model(path)
+    else:
+        model = _load_mapped_model(path)
+        if model is None:
+            model = _load_npz_model(path)
+        model.image_size = tuple(model.input_shape[1:3])
+
+    _MODELS[key] = model
+    return model
+
+
+def _load_npz_model(path: str) -> tf.keras.Model:
+    """
+    Load a model saved with compressed weights in model/weights.npz.
+
+    Args:
+        path: Path of the zip file
     """
+    import tensorflow as tf
 
-    with zipfile.ZipFile(ZIP_PATH) as zf:
+    with zipfile.ZipFile(path) as zf:
         model_architecture = zf.read("model/architecture.json").decode("utf-8")
         model = tf.keras.models.model_from_json(model_architecture)
 
@@ -1,9 +1,10 @@
-import matplotlib.pyplot as plt
 from typing import List
 from utils.parsing.parse import Type
 
 
 def plot_types(types: List[Type]) -> None:
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(len(types), 2)
     for i, type in enumerate(types):
         sizes = type.labels.values()
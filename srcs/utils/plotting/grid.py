@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from matplotlib import pyplot as plt
 from typing import List, Optional
 
 Array = np.ndarray
@@ -21,6 +20,8 @@ def show_grid(
         max_cols (int, default=5): Maximum number of columns in the grid.
         dpi (int, default=120): Resolution (dots per inch) of the figure.
     """
+    from matplotlib import pyplot as plt
+
     n = len(images)
     cols = min(max_cols, n)
     rows = math.ceil(n / cols)
@@ -0,0 +1,399 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+# Written by --profile when no path is given
+DEFAULT_PROFILE_PATH = Path("profile.json")
+
+PERCENTILES = (50, 90, 99)
+
+
+class Span(NamedTuple):
+    """
+    One timed op call, on one image or a batch of them, or one script stage.
+    """
+
+    name: str
+    # "op" or "stage"
+    kind: str
+    # time.perf_counter() at the start, comparable across processes on Linux
+    start: float
+    wall: float
+    cpu: float
+    # Peak bytes allocated through Python and NumPy during the call, None for
+    # stages (their ops reset the peak) and for ops overlapping another one
+    allocated: Optional[int]
+    images: int
+    pid: int
+    tid: int
+    failed: bool
+
+
+class Profiler:
+    """
+    Record op calls and script stages, then summarize them per image.
+
+    Ops measure the CPU time of their own thread, stages that of the whole
+    process. Allocated bytes come from tracemalloc, which only sees memory
+    requested through Python (NumPy and OpenCV outputs included). Its peak is
+    process-wide, so they are only recorded for the ops that ran alone: ops
+    overlapping in other threads of the process get no allocation measure.
+    """
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        # Name, wall clock and process CPU time at the start of the current stage
+        self._stage: Optional[Tuple[str, float, float]] = None
+        # Ops running in the threads of this process, and a counter of op
+        # starts and ends telling whether another op ran during one
+        self._lock = threading.Lock()
+        self._running = 0
+        self._events = 0
+
+    def _enter_op(self) -> Tuple[bool, int]:
+        with self._lock:
+            self._running += 1
+            self._events += 1
+            return self._running == 1, self._events
+
+    def _exit_op(self, alone: bool, events: int) -> bool:
+        with self._lock:
+            alone = alone and self._events == events
+            self._running -= 1
+            self._events += 1
+            return alone
+
+    def _add(self, name: str, kind: str, start: float, **measures: Any) -> None:
+        self.spans.append(
+            Span(
+                name=name,
+                kind=kind,
+                start=start,
+                pid=os.getpid(),
+                tid=threading.get_native_id(),
+                **measures,
+            )
+        )
+
+    @contextlib.contextmanager
+    def op(self, name: str, images: int = 1) -> Iterator[None]:
+        """
+        Time an op call on `images` images.
+        """
+        alone, events = self._enter_op()
+        # Resetting the peak would spoil the measure of an op already running
+        tracing = alone and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        failed = True
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+            failed = False
+        finally:
+            wall, cpu = time.perf_counter() - start, time.thread_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] if tracing else 0
+            alone = self._exit_op(alone, events)
+            self._add(
+                name,
+                "op",
+                start,
+                wall=wall,
+                cpu=cpu,
+                allocated=peak - baseline if tracing and alone else None,
+                images=images,
+                failed=failed,
+            )
+
+    def stage(self, name: Optional[str]) -> None:
+        """
+        End the current stage and start the next one, unless `name` is None.
+        """
+        if self._stage is not None:
+            previous, start, cpu = self._stage
+            self._add(
+                previous,
+                "stage",
+                start,
+                wall=time.perf_counter() - start,
+                cpu=time.process_time() - cpu,
+                allocated=None,
+                images=0,
+                failed=False,
+            )
+        self._stage = (
+            None if name is None else (name, time.perf_counter(), time.process_time())
+        )
+
+    def drain(self) -> List[Span]:
+        """
+        Remove and return the recorded spans, to send them to another process.
+        """
+        spans, self.spans = self.spans, []
+        return spans
+
+    def summary(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Aggregate the spans by name.
+
+        A batched call on N images counts as N images each taking 1/N of it,
+        so the percentiles of batched and per-image ops compare.
+
+        Returns:
+            Per-op image counts, totals and per-image percentiles, and the
+            duration of every stage
+        """
+        ops: Dict[str, List[Span]] = {}
+        for span in self.spans:
+            if span.kind == "op":
+                ops.setdefault(span.name, []).append(span)
+        total = sum(span.wall for spans in ops.values() for span in spans)
+
+        rows = []
+        for name, spans in ops.items():
+            images = np.array([span.images for span in spans])
+            wall = np.repeat([span.wall / span.images for span in spans], images)
+            cpu = sum(span.cpu for span in spans)
+            allocated = [span.allocated for span in spans if span.allocated is not None]
+            rows.append(
+                {
+                    "op": name,
+                    "calls": len(spans),
+                    "images": int(images.sum()),
+                    "failed": sum(span.failed for span in spans),
+                    "wall_seconds": float(sum(span.wall for span in spans)),
+                    "share": float(sum(span.wall for span in spans) / max(total, 1e-9)),
+                    **{
+                        f"p{q}_ms": float(np.percentile(wall, q) * 1000)
+                        for q in PERCENTILES
+                    },
+                    "cpu_ms_per_image": float(cpu / max(images.sum(), 1) * 1000),
+                    "max_allocated_bytes": max(allocated) if allocated else None,
+                    # Calls that ran alone, the only ones with an allocation measure
+                    "allocated_calls": len(allocated),
+                }
+            )
+        rows.sort(key=lambda row: row["wall_seconds"], reverse=True)
+
+        stages = [
+            {"stage": span.name, "wall_seconds": span.wall, "cpu_seconds": span.cpu}
+            for span in self.spans
+            if span.kind == "stage"
+        ]
+        return {"ops": rows, "stages": stages}
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        if summary["stages"]:
+            print(f"\n{'stage':<20}{'wall s':>10}{'cpu s':>10}")
+            for stage in summary["stages"]:
+                print(
+                    f"{stage['stage']:<20}{stage['wall_seconds']:>10.2f}"
+                    f"{stage['cpu_seconds']:>10.2f}"
+                )
+        if summary["ops"]:
+            print(
+                f"\n{'op':<20}{'images':>8}{'total s':>9}{'share':>8}"
+                + "".join(f"{f'p{q} ms':>9}" for q in PERCENTILES)
+                + f"{'cpu ms':>9}{'alloc MiB':>11}"
+            )
+            for row in summary["ops"]:
+                allocated = row["max_allocated_bytes"]
+                print(
+                    f"{row['op']:<20}{row['images']:>8}{row['wall_seconds']:>9.2f}"
+                    f"{row['share']:>8.1%}"
+                    + "".join(f"{row[f'p{q}_ms']:>9.2f}" for q in PERCENTILES)
+                    + f"{row['cpu_ms_per_image']:>9.2f}"
+                    + (f"{allocated / 2**20:>11.1f}" if allocated else f"{'-':>11}")
+                )
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """
+        The spans as complete events of the Chrome trace format.
+        """
+        origin = min((span.start for span in self.spans), default=0.0)
+        return [
+            {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": (span.start - origin) * 1e6,
+                "dur": span.wall * 1e6,
+                "pid": span.pid,
+                "tid": span.tid,
+                "args": {
+                    "cpu_ms": span.cpu * 1000,
+                    "allocated_bytes": span.allocated,
+                    "images": span.images,
+                    "failed": span.failed,
+                },
+            }
+            for span in self.spans
+        ]
+
+    def save(self, path: Path) -> None:
+        """
+        Write the trace and its summary to JSON.
+
+        The file opens in chrome://tracing or https://ui.perfetto.dev, which
+        ignore the extra "summary" key.
+        """
+        path.write_text(
+            json.dumps(
+                {
+                    "traceEvents": self.trace_events(),
+                    "displayTimeUnit": "ms",
+                    "summary": self.summary(),
+                }
+            )
+        )
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    """
+    Add `--profile [PATH]` to the parser of an entry point.
+    """
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_PROFILE_PATH,
+        default=None,
+        help="Time every transformation op and stage, print a summary and write "
+        f"a Chrome trace to PATH (default: {DEFAULT_PROFILE_PATH}); tracing "
+        "allocations slows the ops down",
+    )
+
+
+# Profiler recording the ops of this process, None when profiling is off
+_PROFILER: Optional[Profiler] = None
+
+
+def active_profiler() -> Optional[Profiler]:
+    return _PROFILER
+
+
+def enable_profiling() -> Profiler:
+    """
+    Start recording in this process, e.g. in a worker of a profiled parent.
+    """
+    global _PROFILER
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def disable_profiling() -> Optional[Profiler]:
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.stage(None)
+        tracemalloc.stop()
+    return profiler
+
+
+@contextlib.contextmanager
+def profiling(path: Optional[Path]) -> Iterator[Optional[Profiler]]:
+    """
+    Profile the ops and stages run in the block, unless `path` is None.
+
+    On exit, prints the summary tables and writes the trace to `path`.
+
+    Args:
+        path: Where to write the trace
+    """
+    if path is None:
+        yield None
+        return
+
+    profiler = enable_profiling()
+    try:
+        yield profiler
+    finally:
+        disable_profiling()
+        profiler.print_summary()
+        profiler.save(path)
+        print(f"✅ Profile saved to {path}")
+
+
+def measure_op(name: str, images: int = 1) -> ContextManager[None]:
+    """
+    Time an op call if profiling is on, and do nothing otherwise.
+    """
+    if _PROFILER is None:
+        return contextlib.nullcontext()
+    return _PROFILER.op(name, images)
+
+
+def stage(name: str) -> None:
+    """
+    Mark the start of a script stage, which ends where the next one starts.
+    """
+    if _PROFILER is not None:
+        _PROFILER.stage(name)
+
+
+def record(spans: Iterable[Span]) -> None:
+    """
+    Add spans recorded by another process.
+    """
+    if _PROFILER is not None:
+        _PROFILER.spans.extend(spans)
+
+
+def _status_bytes(field: str) -> Optional[int]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_memory() -> int:
+    """
+    Resident set size of the process, in bytes (0 where Linux /proc is missing).
+    """
+    return _status_bytes("VmRSS") or 0
+
+
+def reset_peak_memory() -> None:
+    """
+    Reset the peak resident set size of the process, where Linux allows it.
+    """
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def peak_memory() -> int:
+    """
+    Peak resident set size of the process since the last reset, in bytes.
+    """
+    peak = _status_bytes("VmHWM")
+    if peak is not None:
+        return peak
+    # Kilobytes on Linux, and never reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, TextIO, Tuple, TYPE_CHECKING
+from .images import load_image
+from .transforms import transform_images
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+PREDICT_OPS = ["hull_xor_fill", "remove_background", "crop_blur"]
+
+
+def rank_predictions(
+    probabilities: np.ndarray, class_names: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    Sort the class probabilities of one image by decreasing confidence.
+
+    Args:
+        probabilities: Model output for one image
+        class_names: Class name of every output
+
+    Returns:
+        List of {"class", "probability"} dictionaries
+    """
+    indices = np.argsort(probabilities)[::-1]
+    return [
+        {"class": class_names[idx], "probability": float(probabilities[idx])}
+        for idx in indices
+    ]
+
+
+def _parse_request(line: str) -> Dict[str, Any]:
+    # Either a bare image path or a JSON object with a "path" field
+    if line.startswith("{"):
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Request is not a JSON object")
+        return request
+    return {"path": line}
+
+
+def _read_requests(stream: TextIO, requests: queue.Queue) -> None:
+    for line in stream:
+        line = line.strip()
+        if line:
+            requests.put(line)
+    requests.put(None)
+
+
+def _next_batch(
+    requests: queue.Queue, max_batch_size: int, max_latency: float
+) -> Tuple[List[str], bool]:
+    """
+    Wait for a request, then gather more until the batch or latency budget is full.
+
+    Returns:
+        Tuple of (batch of request lines, whether the input stream is closed)
+    """
+    first: Optional[str] = requests.get()
+    if first is None:
+        return [], True
+
+    batch = [first]
+    deadline = time.monotonic() + max_latency
+    while len(batch) < max_batch_size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            line = requests.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if line is None:
+            return batch, True
+        batch.append(line)
+    return batch, False
+
+
+def _predict_batch(model: tf.keras.Model, lines: List[str]) -> List[Dict[str, Any]]:
+    """
+    Answer a batch of request lines, with an error response for the failed ones.
+
+    A request failing to load only fails itself, a failure of the transform
+    or model call fails the whole batch, never the server.
+    """
+    responses: List[Dict[str, Any]] = []
+    images: List[np.ndarray] = []
+    # Position in `responses` and request of every loaded image
+    loaded: List[Tuple[int, Dict[str, Any]]] = []
+
+    for line in lines:
+        # Echoed as is when the line is not valid JSON
+        request: Dict[str, Any] = {"request": line}
+        try:
+            request = _parse_request(line)
+            if "path" not in request:
+                raise ValueError("Request has no path")
+            images.append(load_image(request["path"], model.image_size))
+            loaded.append((len(responses), request))
+            responses.append(request)
+        except Exception as e:
+            responses.append({**request, "error": str(e)})
+
+    if not images:
+        return responses
+    try:
+        transformed = transform_images(images, PREDICT_OPS)
+        batch = np.stack([image.astype(np.uint8) for image in transformed])
+        probabilities = model.predict_on_batch(batch)
+    except Exception as e:
+        for i, request in loaded:
+            responses[i] = {**request, "error": str(e)}
+        return responses
+
+    for (i, request), probs in zip(loaded, probabilities):
+        responses[i] = {
+            **request,
+            "predictions": rank_predictions(probs, model.class_names),
+        }
+    return responses
+
+
+def serve(
+    model: tf.keras.Model,
+    stream_in: TextIO,
+    stream_out: TextIO,
+    max_batch_size: int,
+    max_latency: float,
+) -> None:
+    """
+    Answer a stream of prediction requests with a model loaded once.
+
+    Every input line is an image path or a JSON object with a "path" field.
+    Requests are grouped into batches of at most `max_batch_size`, waiting at
+    most `max_latency` seconds after the first one, and every request gets a
+    JSON line back, in order. A response echoes the fields of its request
+    (`{"path": line}` for a bare path, `{"request": line}` for a line that is
+    not valid JSON) with either "predictions", its ranked class
+    probabilities, or "error". Diagnostics go to stderr.
+
+    Args:
+        model: Trained model with `class_names` and `image_size`
+        stream_in: Stream of requests, one per line
+        stream_out: Stream receiving one JSON response per request
+        max_batch_size: Maximum number of images per model call
+        max_latency: Maximum time to wait for a batch to fill, in seconds
+    """
+    requests: queue.Queue = queue.Queue()
+    reader = threading.Thread(
+        target=_read_requests, args=(stream_in, requests), daemon=True
+    )
+    reader.start()
+
+    closed = False
+    while not closed:
+        lines, closed = _next_batch(requests, max_batch_size, max_latency)
+        if not lines:
+            continue
+        for response in _predict_batch(model, lines):
+            stream_out.write(json.dumps(response) + "\n")
+        stream_out.flush()
@@ -0,0 +1,123 @@
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+
+def listing_labels(
+    file_paths: List[str], directory: str, class_names: List[str]
+) -> np.ndarray:
+    """
+    Recover the labels of a dataset from its file listing, without reading it.
+
+    Args:
+        file_paths: Paths listed by `image_dataset_from_directory`, in order
+        directory: Directory the dataset was loaded from
+        class_names: Class names of the dataset, in label order
+
+    Returns:
+        Integer label of every file, in the same order
+    """
+    # The dataset's own class list: listing the directory again would also
+    # count the hidden directories Keras skips
+    labels = {name: label for label, name in enumerate(class_names)}
+    return np.array(
+        [labels[Path(path).relative_to(directory).parts[0]] for path in file_paths],
+        dtype=np.int32,
+    )
+
+
+def _class_counts(labels: np.ndarray) -> Dict[int, int]:
+    """
+    Count the samples of each class.
+
+    Args:
+        labels: Integer label of every sample
+
+    Returns:
+        Dictionary mapping each label to its number of samples
+    """
+    values, counts = np.unique(labels, return_counts=True)
+    return {int(label): int(count) for label, count in zip(values, counts)}
+
+
+def _select(
+    dataset: tf.data.Dataset, labels: np.ndarray, keep: np.ndarray
+) -> tf.data.Dataset:
+    """
+    Keep the samples of a dataset whose position is flagged in `keep`.
+
+    Args:
+        dataset: Dataset with a deterministic order
+        labels: Integer label of every sample
+        keep: Boolean flag of every sample
+
+    Returns:
+        Selected tf.data.Dataset with known cardinality, labels, class counts
+        and positions in the unsplit dataset
+    """
+    flags = tf.constant(keep)
+    selected = (
+        dataset.enumerate()
+        .filter(lambda i, _: flags[i])
+        .map(lambda _, sample: sample)
+        .apply(tf.data.experimental.assert_cardinality(int(keep.sum())))
+    )
+    selected.class_names = dataset.class_names
+    selected.labels = labels[keep]
+    positions = getattr(dataset, "positions", np.arange(len(labels)))
+    selected.positions = positions[keep]
+    selected.class_counts = _class_counts(selected.labels)
+    return selected
+
+
+def split_dataset(
+    dataset: tf.data.Dataset, labels: np.ndarray, left_size: float, seed: int
+) -> Tuple[tf.data.Dataset, tf.data.Dataset]:
+    """
+    Randomly split a dataset in two by position, without reading it.
+
+    Unlike `tf.keras.utils.split_dataset`, no sample is loaded in memory: the
+    dataset must yield its samples in the same order on every iteration (e.g.
+    loaded with `shuffle=False`), and each side filters them lazily.
+
+    Args:
+        dataset: Dataset with a deterministic order
+        labels: Integer label of every sample, in the same order
+        left_size: Fraction of the samples in the left dataset
+        seed: Seed of the split
+
+    Returns:
+        Tuple of (left, right) tf.data.Dataset
+    """
+    order = np.random.default_rng(seed).permutation(len(labels))
+    left = np.zeros(len(labels), dtype=bool)
+    left[order[: round(left_size * len(labels))]] = True
+    return _select(dataset, labels, left), _select(dataset, labels, ~left)
+
+
+def split_manifest(
+    source: str, splits: Dict[str, tf.data.Dataset], **extra: Any
+) -> Dict[str, Any]:
+    """
+    Describe the samples of each split, to reference them instead of saving them.
+
+    Args:
+        source: Dataset the splits were taken from
+        splits: Datasets returned by `split_dataset`, by name
+        **extra: Additional fields of the manifest
+
+    Returns:
+        JSON serializable manifest with the positions and labels of every split
+    """
+    return {
+        "source": source,
+        "splits": {
+            name: {
+                "positions": split.positions.tolist(),
+                "labels": split.labels.tolist(),
+            }
+            for name, split in splits.items()
+        },
+        **extra,
+    }
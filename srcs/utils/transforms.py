@@ -1,9 +1,34 @@
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import sys
 import numpy as np
-import tensorflow as tf
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
 from transforms.base import Transformation
+from transforms.context import OpContext
 from transforms.registry import build, available_ops
-from typing import List, Dict, Any, Set, Generator, Tuple
-from plantcv import plantcv as pcv
+from .profiling import Span, active_profiler, enable_profiling, measure_op, record
+from typing import (
+    List,
+    Dict,
+    Any,
+    Callable,
+    Set,
+    Generator,
+    Tuple,
+    Deque,
+    Optional,
+    NamedTuple,
+    TYPE_CHECKING,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import tensorflow as tf
 
 
 _OP_DEPS: Dict[str, List[str]] = {
@@ -21,6 +46,35 @@ _OP_DEPS: Dict[str, List[str]] = {
 }
 
 
+# `OpContext` fields each op reads and writes, "image" stands for the image
+# passed from one op to the next
+_OP_KEYS: Dict[str, Tuple[List[str], List[str]]] = {
+    "gaussian_blur": (["image"], ["gaussian_blur"]),
+    "rgb2lab": (["image", "gaussian_blur"], ["lab"]),
+    "mask": (["lab"], ["mask"]),
+    "fill_holes": (["mask"], ["fill_holes"]),
+    "analyse": (["mask"], ["analyse_results", "analyse", "analyse_value"]),
+    "select_mask": (["analyse_results"], ["selected_mask"]),
+    "veins": (["lab", "mask", "selected_mask"], ["veins"]),
+    "hull_xor_fill": (["mask", "selected_mask"], ["corrected_mask"]),
+    "remove_background": (
+        ["image", "mask", "selected_mask", "corrected_mask"],
+        ["image", "remove_background"],
+    ),
+    "crop": (["image", "selected_mask", "analyse_results"], ["image"]),
+    "crop_blur": (["image"], ["image"]),
+}
+
+
+class _Plan(NamedTuple):
+    """
+    Ops to run for the requested outputs and ctx fields to drop after each of them.
+    """
+
+    ops: List[Transformation]
+    release: List[List[str]]
+
+
 def _resolve_deps_for(op: str, ordered: List[str], seen: Set[str]) -> None:
     if op in seen:
         return
@@ -45,55 +99,290 @@ def resolve_ops(requested_ops: List[str]) -> List[str]:
     return ordered
 
 
-def _build_ops(ops_list: List[str]) -> List[Transformation]:
+def build_ops(
+    ops_list: List[str], params: Optional[Dict[str, Dict[str, Any]]] = None
+) -> List[Transformation]:
+    """
+    Build the requested operations and their dependencies, in dependency order.
+
+    Args:
+        ops_list: Names of the operations
+        params: Constructor arguments of the operations, by name
+
+    Returns:
+        Built transformation operations
+    """
     ops: List[Transformation] = []
     ordered_ops = resolve_ops(ops_list)
     for op in ordered_ops:
-        ops.append(build(op))
+        ops.append(build(op, **(params or {}).get(op, {})))
     return ops
 
 
+def _plan_ops(ops: List[Transformation], outputs: Set[str]) -> _Plan:
+    """
+    Keep only the ops contributing to `outputs` and schedule intermediate release.
+
+    Walks the ops backwards to find which ctx keys are still needed, then
+    records after which op each intermediate key has its last use.
+
+    Args:
+        ops: Built transformation operations, in dependency order
+        outputs: Keys needed at the end ("image" for the final image)
+
+    Returns:
+        Execution plan
+    """
+    needed = set(outputs)
+    kept: List[Transformation] = []
+    for op in reversed(ops):
+        reads, writes = _OP_KEYS[op.name]
+        if needed.isdisjoint(writes):
+            continue
+        kept.insert(0, op)
+        needed = (needed - set(writes)) | set(reads)
+
+    last_use: Dict[str, int] = {}
+    for i, op in enumerate(kept):
+        reads, writes = _OP_KEYS[op.name]
+        for key in reads + writes:
+            last_use[key] = i
+
+    release: List[List[str]] = [[] for _ in kept]
+    for key, i in last_use.items():
+        if key != "image" and key not in outputs:
+            release[i].append(key)
+
+    return _Plan(ops=kept, release=release)
+
+
+def transformation_cache_key(
+    file_paths: List[str], ops: List[str], image_size: Tuple[int, int]
+) -> str:
+    """
+    Hash everything that determines the output of `transform_dataset`.
+
+    Args:
+        file_paths: Paths of the source images, in loading order
+        ops: List of transformation operations to apply
+        image_size: (height, width) the images are loaded at
+
+    Returns:
+        Hex digest identifying the transformed dataset
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{image_size[0]}x{image_size[1]}\n".encode())
+    for op in build_ops(ops):
+        params = sorted(vars(op).items())
+        digest.update(f"{op.name}:{params!r}\n".encode())
+    # Order dependent: the cache stores samples in the order they were listed
+    digest.update(f"{len(file_paths)} files\n".encode())
+    for path in file_paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
+def _apply_ops(
+    image: np.ndarray, ops: List[Transformation]
+) -> Tuple[np.ndarray, OpContext]:
+    """
+    Run an image through a list of built operations.
+
+    Args:
+        image: Input image as numpy array
+        ops: Built transformation operations, in dependency order
+
+    Returns:
+        Tuple of (final image, context filled by the operations)
+    """
+    ctx = OpContext(images={"original": image})
+
+    _img = image
+    for op in ops:
+        op_name = getattr(op, "name", None) or op.__class__.__name__
+        try:
+            with measure_op(op_name):
+                _img = op.apply(_img, ctx)
+            ctx.images[op_name] = _img
+        except Exception as e:
+            print(f"Could not apply operation {op}: {e}", file=sys.stderr)
+
+    return _img, ctx
+
+
+def _apply_ops_batch(images: List[np.ndarray], plan: _Plan) -> List[np.ndarray]:
+    """
+    Run a chunk of images through a plan of built operations, one op at a time.
+
+    Operations exposing `apply_batch` process the whole chunk in one call, the
+    others (or a failed batch call) fall back to one `apply` per image. The
+    (N, H, W, C) array a batch call returns goes to the next one as is. Only
+    the final images are kept, intermediates are dropped after their last use.
+
+    Args:
+        images: Input images as numpy arrays
+        plan: Execution plan from `_plan_ops`
+
+    Returns:
+        Final image for every input image
+    """
+    ctxs = [OpContext() for _ in images]
+    _imgs: Union[np.ndarray, List[np.ndarray]] = list(images)
+
+    for op, release in zip(plan.ops, plan.release):
+        if hasattr(op, "apply_batch"):
+            try:
+                with measure_op(op.name, len(ctxs)):
+                    _imgs = op.apply_batch(np.asarray(_imgs), ctxs)
+            except Exception as e:
+                # On stderr: stdout carries the responses of predict.py --serve
+                print(
+                    f"Could not apply operation {op} on a batch: {e}", file=sys.stderr
+                )
+            else:
+                _release(ctxs, release)
+                continue
+
+        _imgs = list(_imgs)
+        for i, ctx in enumerate(ctxs):
+            try:
+                with measure_op(op.name):
+                    _imgs[i] = op.apply(_imgs[i], ctx)
+            except Exception as e:
+                print(f"Could not apply operation {op}: {e}", file=sys.stderr)
+        _release(ctxs, release)
+
+    return list(_imgs)
+
+
+def _release(ctxs: List[OpContext], keys: List[str]) -> None:
+    for ctx in ctxs:
+        ctx.release(keys)
+
+
+def _chunks(
+    dataset: tf.data.Dataset, chunk_size: int
+) -> Generator[Tuple[List[np.ndarray], List[int]], None, None]:
+    images: List[np.ndarray] = []
+    labels: List[int] = []
+    for image, label in dataset.as_numpy_iterator():
+        images.append(image)
+        labels.append(label)
+        if len(images) == chunk_size:
+            yield images, labels
+            images, labels = [], []
+    if images:
+        yield images, labels
+
+
+# Execution plan built once per worker process by `init_worker`
+_WORKER_PLAN: Optional[_Plan] = None
+
+
+def init_worker(ops: List[str], profile: bool = False) -> None:
+    """
+    Plan the ops run by `transform_chunk` in this process.
+
+    Meant as the initializer of a process pool, or called once before
+    transforming chunks in-process.
+
+    Args:
+        ops: List of transformation operations to apply
+        profile: Profile the op calls of this process
+    """
+    global _WORKER_PLAN
+    _WORKER_PLAN = _plan_ops(build_ops(ops), {"image"})
+    if profile:
+        enable_profiling()
+
+
+def transform_chunk(images: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Transform a chunk of images with the ops planned by `init_worker`.
+
+    Args:
+        images: Input images as numpy arrays
+
+    Returns:
+        Transformed images, in input order
+    """
+    assert _WORKER_PLAN is not None, "Worker has not been initialised"
+    return _apply_ops_batch(images, _WORKER_PLAN)
+
+
+def _transform_chunk_profiled(
+    images: List[np.ndarray],
+) -> Tuple[List[np.ndarray], List[Span]]:
+    """
+    Transform a chunk in a worker, with the op calls profiled meanwhile.
+    """
+    transformed = transform_chunk(images)
+    profiler = active_profiler()
+    return transformed, profiler.drain() if profiler is not None else []
+
+
+def transform_images(images: List[np.ndarray], ops: List[str]) -> List[np.ndarray]:
+    """
+    Transform a batch of images, keeping only the final image of each.
+
+    Args:
+        images: Input images as numpy arrays
+        ops: List of transformation operations to apply
+
+    Returns:
+        Transformed images, in input order
+    """
+    return _apply_ops_batch(images, _plan_ops(build_ops(ops), {"image"}))
+
+
 def extract_variants(  # noqa: C901
     original_img: np.ndarray,
-    ctx: Dict[str, Any],
+    ctx: OpContext,
     applied_ops: List[str],
     requested_ops: List[str],
 ) -> Dict[str, np.ndarray]:
     variants: Dict[str, np.ndarray] = {"original": original_img}
 
-    if "gaussian_blur" in applied_ops and "gaussian_blur" in ctx:
-        variants["gaussian_blur"] = ctx["gaussian_blur"]
+    if "gaussian_blur" in applied_ops and ctx.gaussian_blur is not None:
+        variants["gaussian_blur"] = ctx.gaussian_blur
 
-    if "lab" in ctx:
-        variants["lab_l"] = ctx["lab"]["l"]
+    if ctx.lab is not None:
+        variants["lab_l"] = ctx.lab["l"]
 
-    if "mask" in ctx:
-        ch = ctx["selected_mask"] if "selected_mask" in ctx else "l"
-        variants["mask"] = ctx["mask"][ch]
+    if ctx.mask is not None:
+        ch = ctx.selected_mask or "l"
+        variants["mask"] = ctx.mask[ch]
 
-        if "fill_holes" in ctx:
-            variants["fill_holes"] = ctx["fill_holes"][ch]
+        if ctx.fill_holes is not None:
+            variants["fill_holes"] = ctx.fill_holes[ch]
 
-    if "mask" in ctx and "selected_mask" in ctx:
-        selected_ch = ctx["selected_mask"]
-        if "fill_holes" in ctx:
-            variants["select_mask"] = ctx["fill_holes"][selected_ch]
+    if ctx.mask is not None and ctx.selected_mask is not None:
+        selected_ch = ctx.selected_mask
+        if ctx.fill_holes is not None:
+            variants["select_mask"] = ctx.fill_holes[selected_ch]
         else:
-            variants["select_mask"] = ctx["mask"][selected_ch]
-
-    if "analyse" in ctx and "selected_mask" in ctx:
-        variants["analyse"] = ctx["analyse"][ctx["selected_mask"]]
+            variants["select_mask"] = ctx.mask[selected_ch]
 
-    if "veins" in ctx:
-        variants["veins"] = ctx["veins"]
+    if ctx.analyse is not None and ctx.selected_mask is not None:
+        variants["analyse"] = ctx.analyse[ctx.selected_mask]
 
-    if "hull_mask" in ctx:
-        variants["hull_mask"] = ctx["hull_mask"]
+    if ctx.veins is not None:
+        variants["veins"] = ctx.veins
 
-    if "hull_xor_result" in ctx:
-        variants["hull_xor_result"] = ctx["hull_xor_result"]
+    if (
+        ctx.corrected_mask is not None
+        and ctx.mask is not None
+        and ctx.selected_mask is not None
+    ):
+        # The filled hulls cover the mask: they are the corrected mask, and
+        # their XOR with the mask is what the correction added
+        variants["hull_mask"] = ctx.corrected_mask
+        variants["hull_xor_result"] = np.bitwise_xor(
+            ctx.corrected_mask, ctx.mask[ctx.selected_mask]
+        )
 
-    images = ctx.get("_images", {})
+    images = ctx.images
 
     if "remove_background" in applied_ops and "remove_background" in images:
         variants["remove_background"] = images["remove_background"]
@@ -108,7 +397,7 @@ def extract_variants(  # noqa: C901
 
 
 def create_transformed_generator(
-    dataset: tf.data.Dataset, ops: List[str]
+    dataset: tf.data.Dataset, ops: List[str], chunk_size: int = 64
 ) -> Generator[Tuple[np.ndarray, int], None, None]:
     """
     Generator that yields transformed images.
@@ -116,34 +405,74 @@ def create_transformed_generator(
     Args:
         dataset: Original tf.data.Dataset
         ops: List of transformation operations to apply
+        chunk_size: Number of images transformed together by batched ops
 
     Returns:
         Generator yielding tuples of (image, label)
     """
-    _ops = _build_ops(ops)
+    plan = _plan_ops(build_ops(ops), {"image"})
     print(f"⏳ Applying transformations: {', '.join([op for op in ops])}")
 
     # Yield transformed samples
-    for image, label in dataset.as_numpy_iterator():
-        ctx: Dict[str, Any] = {"_images": {"original": image}}
-        pcv.outputs.clear()
+    for images, labels in _chunks(dataset, chunk_size):
+        yield from zip(_apply_ops_batch(images, plan), labels)
 
-        _img = image
-        for op in _ops:
-            try:
-                _img = op.apply(_img, ctx)
-                op_name = getattr(op, "name", None) or op.__class__.__name__
-                ctx["_images"][op_name] = _img
-            except Exception as e:
-                print(f"Could not apply operation {op}: {e}")
 
-        yield _img, label
+def create_parallel_transformed_generator(
+    dataset: tf.data.Dataset, ops: List[str], workers: int, chunk_size: int = 64
+) -> Generator[Tuple[np.ndarray, int], None, None]:
+    """
+    Generator that yields transformed images computed by a pool of processes.
+
+    Images are sent to the workers in chunks and yielded back in dataset order,
+    with at most two chunks per worker in flight at any time.
+
+    Args:
+        dataset: Original tf.data.Dataset
+        ops: List of transformation operations to apply
+        workers: Number of worker processes
+        chunk_size: Number of images sent to a worker at once
+
+    Returns:
+        Generator yielding tuples of (image, label)
+    """
+    resolve_ops(ops)
+    print(
+        f"⏳ Applying transformations: {', '.join([op for op in ops])} "
+        f"({workers} workers)"
+    )
+
+    # TensorFlow is not fork-safe, workers have to start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    pending: Deque[Tuple[List[int], Future]] = deque()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(ops, active_profiler() is not None),
+    ) as pool:
+
+        def drain(max_pending: int) -> Generator[Tuple[np.ndarray, int], None, None]:
+            while len(pending) > max_pending:
+                labels, future = pending.popleft()
+                images, spans = future.result()
+                record(spans)
+                yield from zip(images, labels)
+
+        for images, labels in _chunks(dataset, chunk_size):
+            pending.append((labels, pool.submit(_transform_chunk_profiled, images)))
+            yield from drain(2 * workers)
+        yield from drain(0)
 
 
 def transform_dataset(
     dataset: tf.data.Dataset,
     ops: List[str],
     cache_path: str | None = ".tf-cache/transformation/",
+    workers: int = 1,
+    chunk_size: int = 64,
+    on_cached: Optional[Callable[[], None]] = None,
 ) -> tf.data.Dataset:
     """
     Transform the dataset to create preprocessed samples.
@@ -151,20 +480,40 @@ def transform_dataset(
     Args:
         dataset: Original tf.data.Dataset
         ops: List of transformation operations to apply
+        cache_path: Where to cache the transformed samples
+        workers: Number of processes to transform with (1 runs in-process)
+        chunk_size: Number of images transformed together (and sent to a worker)
+        on_cached: Called once the last sample has gone to the cache
 
     Returns:
         Transformed tf.data.Dataset
     """
+    import tensorflow as tf
+
+    if workers > 1:
+        generator = partial(
+            create_parallel_transformed_generator, dataset, ops, workers, chunk_size
+        )
+    else:
+        generator = partial(create_transformed_generator, dataset, ops, chunk_size)
+
+    def generate() -> Generator[Tuple[np.ndarray, int], None, None]:
+        yield from generator()
+        # Only runs when filling the cache: a complete cache is read instead
+        if on_cached is not None:
+            on_cached()
 
     transformed_dataset = tf.data.Dataset.from_generator(
-        lambda: create_transformed_generator(dataset, ops),
+        generate,
         output_signature=dataset.element_spec,
     ).cache(filename=cache_path)
 
-    # Force evaluation to apply transformations immediately (and apply cardinality)
-    cardinality = 0
-    for _ in transformed_dataset.as_numpy_iterator():
-        cardinality += 1
+    # One output per input: the cache fills during the first real iteration
+    cardinality = int(dataset.cardinality())
+    if cardinality < 0:
+        cardinality = 0
+        for _ in transformed_dataset.as_numpy_iterator():
+            cardinality += 1
 
     transformed_dataset = transformed_dataset.apply(
         tf.data.experimental.assert_cardinality(cardinality)
@@ -177,6 +526,7 @@ def transform_dataset(
 def transform_one_image(
     image: np.ndarray,
     ops: list[str],
+    params: Optional[Dict[str, Dict[str, Any]]] = None,
 ) -> list[Tuple[np.ndarray, str]]:
     """
     Process a single image through transformation operations.
@@ -184,30 +534,20 @@ def transform_one_image(
     Args:
         img: Input image as numpy array
         ops: List of transformation operations to apply
-        applied_ops: List of operation names that were applied
-        requested_ops: List of operation names that were requested
+        params: Constructor arguments per operation name
 
     Returns:
         List of tuples containing (image, name) for each variant
     """
 
-    _ops = _build_ops(ops)
+    _ops = build_ops(ops, params)
     applied_ops: list[str] = [getattr(op, "name", op.__class__.__name__) for op in _ops]
     requested_ops: list[str] = [op for op in ops]
 
-    ctx: Dict[str, Any] = {"_images": {"original": image}}
-    _img = image
-
-    for op in _ops:
-        try:
-            _img = op.apply(_img, ctx)
-            op_name = getattr(op, "name", None) or op.__class__.__name__
-            ctx["_images"][op_name] = _img
-        except Exception as e:
-            print(f"Could not apply operation {op}: {e}")
+    _, ctx = _apply_ops(image, _ops)
 
     variants = extract_variants(
-        ctx["_images"]["original"], ctx, applied_ops, requested_ops
+        ctx.images["original"], ctx, applied_ops, requested_ops
     )
 
     return [(image, name) for name, image in variants.items()]
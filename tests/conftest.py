@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules import each other from srcs/, as when the scripts run
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "srcs"))
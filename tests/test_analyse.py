@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import leaf_images
+from transforms.context import OpContext
+from transforms.ops.analyse import Analyse
+from transforms.ops.mask import otsu_batch
+from transforms.ops.rgb2lab import rgb2lab_batch
+
+
+def _analyse(engine, img, masks):
+    ctx = OpContext(mask=masks)
+    Analyse(engine).apply(img, ctx)
+    return ctx.analyse_results
+
+
+def test_moments_engine_matches_plantcv():
+    imgs = leaf_images(3, 96, 96)
+    planes = rgb2lab_batch(imgs)
+    dark = otsu_batch(planes[1], "dark")
+    light = otsu_batch(planes[2], "light")
+
+    for img, a, b in zip(imgs, dark, light):
+        masks = {"a": a, "b": b, "empty": np.zeros_like(a)}
+        expected = _analyse("plantcv", img, masks)
+        results = _analyse("moments", img, masks)
+
+        assert results.keys() == expected.keys()
+        for channel, stats in results.items():
+            assert stats == pytest.approx(expected[channel])
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError, match="Unknown analyse engine"):
+        Analyse("skimage")
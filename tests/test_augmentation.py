@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import tensorflow as tf  # noqa: E402
+from utils.augmentation import (  # noqa: E402
+    augment_dataset,
+    create_augmented_generator,
+    create_manifest,
+    load_manifest,
+    save_manifest,
+)
+
+CLASS_NAMES = ["healthy", "rust", "scab"]
+
+
+def _dataset(labels):
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (len(labels), 32, 32, 3), dtype=np.uint8)
+    dataset = tf.data.Dataset.from_tensor_slices((images, np.array(labels)))
+    dataset.class_names = CLASS_NAMES
+    return dataset
+
+
+def _arrays(dataset):
+    images, labels = zip(*dataset.as_numpy_iterator())
+    return np.stack(images), np.array(labels)
+
+
+def test_manifest_round_trip(tmp_path):
+    manifest = create_manifest({0: 5, 1: 2, 2: 4}, CLASS_NAMES, seed=3)
+    assert len(manifest.samples) == 3 + 1
+    assert manifest == create_manifest({0: 5, 1: 2, 2: 4}, CLASS_NAMES, seed=3)
+
+    save_manifest(manifest, tmp_path / "manifest.json")
+    assert load_manifest(tmp_path / "manifest.json") == manifest
+
+
+def test_manifest_images_do_not_depend_on_workers():
+    dataset = _dataset([0, 0, 0, 0, 1, 2, 2])
+    manifest = create_manifest({0: 4, 1: 1, 2: 2}, CLASS_NAMES, seed=0)
+
+    def samples(workers, chunk_size):
+        generator = create_augmented_generator(dataset, manifest, workers, chunk_size)
+        # Chunking changes where the augmentations land between the originals
+        return sorted((int(label), image.tobytes()) for image, label in generator)
+
+    alone = samples(1, 1)
+    assert len(alone) == 7 + len(manifest.samples)
+    assert samples(3, 2) == alone
+
+
+def test_augment_dataset_replays_its_manifest(tmp_path):
+    dataset = _dataset([0, 0, 0, 1, 2, 2])
+    path = tmp_path / "manifest.json"
+
+    first = _arrays(augment_dataset(dataset, seed=1, manifest_path=path))
+    assert path.exists()
+    # Without a seed, the images can only come from the manifest
+    replayed = _arrays(augment_dataset(dataset, workers=2, manifest_path=path))
+    np.testing.assert_array_equal(replayed[0], first[0])
+    np.testing.assert_array_equal(replayed[1], first[1])
+    np.testing.assert_array_equal(np.bincount(first[1]), [3, 3, 3])
+
+
+def test_augment_dataset_refuses_another_split(tmp_path):
+    path = tmp_path / "manifest.json"
+    augment_dataset(_dataset([0, 0, 1]), seed=1, manifest_path=path)
+
+    with pytest.raises(ValueError, match="does not match the dataset"):
+        augment_dataset(_dataset([0, 1, 1]), manifest_path=path)
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import tensorflow as tf  # noqa: E402
+from utils.cache import PersistentCache  # noqa: E402
+
+
+def _entry(cache, key, size, mtime):
+    path = cache.root / key
+    path.mkdir(parents=True)
+    (path / ".data-00000-of-00001").write_bytes(b"x" * size)
+    (path / ".index").touch()
+    os.utime(path, (mtime, mtime))
+
+
+def test_is_complete_once_tf_data_has_written_the_cache(tmp_path):
+    cache = PersistentCache(str(tmp_path))
+    dataset = tf.data.Dataset.range(10).cache(cache.path("key"))
+    assert not cache.is_complete("key")
+
+    # tf.data keeps nothing of a pass that stops early
+    next(iter(dataset))
+    assert not cache.is_complete("key")
+
+    np.testing.assert_array_equal(list(dataset.as_numpy_iterator()), range(10))
+    assert cache.is_complete("key")
+
+
+def test_path_clears_an_interrupted_entry(tmp_path):
+    cache = PersistentCache(str(tmp_path))
+    (tmp_path / "key").mkdir()
+    (tmp_path / "key" / ".data-00000-of-00001").write_bytes(b"partial")
+
+    assert cache.path("key") == (tmp_path / "key").resolve().as_posix() + "/"
+    assert list((tmp_path / "key").iterdir()) == []
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path):
+    cache = PersistentCache(str(tmp_path), max_bytes=250)
+    for mtime, key in enumerate(["oldest", "old", "new", "newest"]):
+        _entry(cache, key, 100, 1_000_000 + mtime)
+
+    # The entry just written survives even if it is the least recently used
+    cache.evict(keep="oldest")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["newest", "oldest"]
+
+    cache.evict()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["newest", "oldest"]
@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import tensorflow as tf  # noqa: E402
+from utils.export import (  # noqa: E402
+    is_export,
+    load_export,
+    read_index,
+    save_npy,
+    save_tfrecords,
+)
+
+CLASS_NAMES = ["healthy", "rust"]
+
+
+@pytest.mark.parametrize("save", [save_tfrecords, save_npy])
+def test_export_round_trip(tmp_path, save):
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (7, 8, 6, 3), dtype=np.uint8)
+    labels = np.array([0, 1, 1, 0, 1, 0, 0])
+    dataset = tf.data.Dataset.from_tensor_slices((images.astype(np.float32), labels))
+
+    # Blocks of 3 samples make 3 shards, the last one partial
+    save(dataset, tmp_path, CLASS_NAMES, ops=["crop"], shard_size=3)
+    assert is_export(tmp_path)
+    assert read_index(tmp_path)["shape"] == [8, 6, 3]
+
+    loaded = load_export(tmp_path)
+    assert int(loaded.cardinality()) == 7
+    assert loaded.class_names == CLASS_NAMES
+    assert loaded.ops == ["crop"]
+    np.testing.assert_array_equal(loaded.labels, labels)
+
+    read_images, read_labels = zip(*loaded.as_numpy_iterator())
+    assert read_images[0].dtype == np.float32
+    np.testing.assert_array_equal(np.stack(read_images), images)
+    np.testing.assert_array_equal(read_labels, labels)
@@ -0,0 +1,71 @@
+import os
+from PIL import Image
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+from utils.incremental import (  # noqa: E402
+    list_sources,
+    load_manifest,
+    plan_update,
+    save_manifest,
+)
+
+OPS = ["blur", "mask"]
+SIZE = (8, 8)
+
+
+def _save(path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (8, 8), color).save(path)
+
+
+def _write_outputs(dst, update):
+    files = {**update.unchanged, **update.changed}
+    for entry in files.values():
+        (dst / entry["output"]).parent.mkdir(parents=True, exist_ok=True)
+        (dst / entry["output"]).touch()
+    save_manifest(dst, OPS, files, SIZE)
+
+
+def test_list_sources_skips_hidden_directories(tmp_path):
+    _save(tmp_path / "healthy" / "a.jpg", "green")
+    _save(tmp_path / "rust" / "b.png", "brown")
+    _save(tmp_path / ".ipynb_checkpoints" / "c.jpg", "white")
+    (tmp_path / "rust" / "notes.txt").write_text("not an image")
+
+    assert list_sources(tmp_path) == ["healthy/a.jpg", "rust/b.png"]
+
+
+def test_plan_update_only_replans_modified_images(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    dst.mkdir()
+    _save(src / "healthy" / "a.jpg", "green")
+    _save(src / "healthy" / "b.jpg", "green")
+    _save(src / "rust" / "c.jpg", "brown")
+
+    first = plan_update(src, dst, list_sources(src), {})
+    assert not first.unchanged and not first.removed
+    assert sorted(first.changed) == ["healthy/a.jpg", "healthy/b.jpg", "rust/c.jpg"]
+    _write_outputs(dst, first)
+
+    # Untouched, rewritten with other pixels, added and removed
+    _save(src / "healthy" / "b.jpg", "yellow")
+    _save(src / "rust" / "d.jpg", "brown")
+    (src / "rust" / "c.jpg").unlink()
+
+    second = plan_update(src, dst, list_sources(src), load_manifest(dst, OPS, SIZE))
+    assert sorted(second.unchanged) == ["healthy/a.jpg"]
+    assert sorted(second.changed) == ["healthy/b.jpg", "rust/d.jpg"]
+    assert second.removed == [first.changed["rust/c.jpg"]["output"]]
+
+
+def test_plan_update_replans_everything_when_ops_change(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    dst.mkdir()
+    _save(src / "healthy" / "a.jpg", "green")
+    _write_outputs(dst, plan_update(src, dst, list_sources(src), {}))
+
+    manifest = load_manifest(dst, ["blur"], SIZE)
+    update = plan_update(src, dst, list_sources(src), manifest)
+    assert not update.unchanged
+    assert sorted(update.changed) == ["healthy/a.jpg"]
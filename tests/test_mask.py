@@ -0,0 +1,27 @@
+import numpy as np
+from plantcv import plantcv as pcv
+from benchmarks.synthetic import leaf_images
+from transforms.ops.mask import otsu_batch
+from transforms.ops.rgb2lab import rgb2lab_batch
+
+
+def test_rgb2lab_batch_matches_plantcv():
+    imgs = leaf_images(3, 64, 64)
+    planes = rgb2lab_batch(imgs)
+
+    for plane, channel in zip(planes, "lab"):
+        for img, gray in zip(imgs, plane):
+            np.testing.assert_array_equal(gray, pcv.rgb2gray_lab(img, channel))
+
+
+def test_otsu_batch_matches_plantcv():
+    planes = rgb2lab_batch(leaf_images(3, 64, 64))
+    # A flat image has no threshold that splits it
+    gray = np.concatenate([planes[1], np.full((1, 64, 64), 128, np.uint8)])
+
+    for object_type in ("light", "dark"):
+        masks = otsu_batch(gray, object_type)
+        assert masks.dtype == np.uint8
+        for image, mask in zip(gray, masks):
+            expected = pcv.threshold.otsu(image, object_type=object_type)
+            np.testing.assert_array_equal(mask, expected)
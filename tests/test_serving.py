@@ -0,0 +1,34 @@
+import io
+import json
+import sys
+import numpy as np
+from PIL import Image
+from utils.serving import serve
+
+
+class FakeModel:
+    image_size = (64, 64)
+    class_names = ["healthy", "rust"]
+
+    def predict_on_batch(self, batch):
+        return np.tile([0.25, 0.75], (len(batch), 1))
+
+
+def test_serve_writes_only_json_lines(tmp_path, capsys):
+    # No leaf to outline: hull_xor_fill fails and reports it
+    blank = tmp_path / "blank.png"
+    Image.new("RGB", (64, 64), (200, 200, 200)).save(blank)
+    requests = "\n".join(
+        [str(blank), json.dumps({"path": str(blank), "id": 7}), '{"id": 8}', "{nope"]
+    )
+
+    serve(FakeModel(), io.StringIO(requests + "\n"), sys.stdout, 2, 0.01)
+
+    captured = capsys.readouterr()
+    responses = [json.loads(line) for line in captured.out.splitlines()]
+    assert "Could not apply operation" in captured.err
+    assert [response.get("id") for response in responses] == [None, 7, 8, None]
+    assert responses[0]["path"] == str(blank)
+    assert responses[1]["predictions"][0]["class"] == "rust"
+    assert responses[2]["error"] == "Request has no path"
+    assert responses[3]["request"] == "{nope" and "error" in responses[3]
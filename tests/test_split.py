@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import tensorflow as tf  # noqa: E402
+from utils.split import listing_labels  # noqa: E402
+
+
+def test_listing_labels_skips_hidden_directories(tmp_path):
+    counts = {"Apple_healthy": 3, "Apple_rust": 2, "Grape_esca": 1}
+    for class_name, count in counts.items():
+        (tmp_path / class_name).mkdir()
+        for i in range(count):
+            Image.new("RGB", (8, 8)).save(tmp_path / class_name / f"{i}.jpg")
+    # Left behind by Jupyter, and skipped by Keras
+    (tmp_path / ".ipynb_checkpoints").mkdir()
+
+    dataset = tf.keras.utils.image_dataset_from_directory(
+        str(tmp_path), image_size=(8, 8), batch_size=None, shuffle=False
+    )
+    labels = listing_labels(dataset.file_paths, str(tmp_path), dataset.class_names)
+
+    expected = np.array([label for _, label in dataset.as_numpy_iterator()])
+    np.testing.assert_array_equal(labels, expected)
+    np.testing.assert_array_equal(np.bincount(labels), [3, 2, 1])
@@ -0,0 +1,39 @@
+import numpy as np
+from benchmarks.synthetic import leaf_images
+from utils.transforms import _apply_ops_batch, _Plan, _plan_ops, build_ops
+
+
+def _names(plan):
+    return [op.name for op in plan.ops]
+
+
+def test_plan_ops_skips_ops_the_outputs_do_not_need():
+    plan = _plan_ops(build_ops(["crop"]), {"image"})
+
+    # Crop reads the analysis, not the filled masks
+    assert _names(plan) == ["rgb2lab", "mask", "analyse", "select_mask", "crop"]
+    # Veins only records its texture, the image goes through unchanged
+    assert _names(_plan_ops(build_ops(["veins"]), {"image"})) == []
+
+
+def test_plan_ops_releases_keys_after_their_last_use():
+    plan = _plan_ops(build_ops(["crop"]), {"image"})
+    release = dict(zip(_names(plan), plan.release))
+
+    assert release["mask"] == ["lab"]
+    assert sorted(release["analyse"]) == ["analyse", "analyse_value", "mask"]
+    assert sorted(release["crop"]) == ["analyse_results", "selected_mask"]
+    # Requested outputs are kept to the end
+    kept = _plan_ops(build_ops(["crop"]), {"image", "mask"})
+    assert all("mask" not in keys for keys in kept.release)
+
+
+def test_planned_ops_give_the_images_of_every_op():
+    images = list(leaf_images(3, 96, 96))
+    for op in ("crop", "remove_background"):
+        ops = build_ops([op])
+        everything = _Plan(ops=ops, release=[[] for _ in ops])
+
+        planned = _apply_ops_batch(images, _plan_ops(ops, {"image"}))
+        for result, expected in zip(planned, _apply_ops_batch(images, everything)):
+            np.testing.assert_array_equal(result, expected)